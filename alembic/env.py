@@ -6,7 +6,7 @@ from sqlalchemy import pool
 from alembic import context
 
 # Import your Base and models
-from app.database import Base
+from app.models import Base
 from app.models import *  # noqa
 
 # Import config
@@ -0,0 +1,42 @@
+"""vacancy list index
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-15 01:31:12.408213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY не блокирует запись в vacancies, но не может выполняться внутри транзакции.
+    # Уникальные индексы по hh_id (ix_vacancies_hh_id, ix_companies_hh_id) созданы в 0001.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_vacancies_status_company',
+            'vacancies',
+            ['status', 'company_id', sa.text('id DESC')],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_vacancies_status_company',
+            table_name='vacancies',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
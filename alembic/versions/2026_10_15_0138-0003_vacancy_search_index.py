@@ -0,0 +1,44 @@
+"""vacancy search index
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-15 01:38:40.117052
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Должно совпадать с app.models.VACANCY_SEARCH_VECTOR
+SEARCH_VECTOR = "to_tsvector('russian', coalesce(title, '') || ' ' || coalesce(description, ''))"
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_vacancy_search_vec',
+            'vacancies',
+            [sa.text(SEARCH_VECTOR)],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_vacancy_search_vec',
+            table_name='vacancies',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,55 @@
+"""vacancy published keyset index
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-15 01:46:37.915402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Новый индекс строится до удаления старого, чтобы список вакансий не остался без индекса
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_vacancy_published_id',
+            'vacancies',
+            [sa.text('published_at DESC NULLS LAST'), sa.text('id DESC'), 'status'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            'ix_vacancy_published',
+            table_name='vacancies',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_vacancy_published',
+            'vacancies',
+            ['published_at', 'status'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            'ix_vacancy_published_id',
+            table_name='vacancies',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
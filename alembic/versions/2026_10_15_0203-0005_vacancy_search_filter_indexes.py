@@ -0,0 +1,56 @@
+"""vacancy search filter indexes
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-15 02:03:51.226870
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_vac_search_multi',
+            'vacancies',
+            ['experience', sa.text('published_at DESC')],
+            unique=False,
+            postgresql_include=['salary_from', 'salary_to'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_vac_salary_from',
+            'vacancies',
+            ['salary_from'],
+            unique=False,
+            postgresql_where=sa.text('salary_from IS NOT NULL'),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_vac_salary_from',
+            table_name='vacancies',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            'ix_vac_search_multi',
+            table_name='vacancies',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
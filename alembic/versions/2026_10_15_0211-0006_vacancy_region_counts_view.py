@@ -0,0 +1,30 @@
+"""vacancy region counts view
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-15 02:11:08.530194
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE MATERIALIZED VIEW IF NOT EXISTS vacancy_region_counts AS "
+        "SELECT region, count(*) AS n FROM vacancies WHERE status = 'active' AND region IS NOT NULL GROUP BY region"
+    )
+    # Уникальный индекс обязателен для REFRESH MATERIALIZED VIEW CONCURRENTLY
+    op.create_index('ix_vacancy_region_counts_region', 'vacancy_region_counts', ['region'], unique=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS vacancy_region_counts")
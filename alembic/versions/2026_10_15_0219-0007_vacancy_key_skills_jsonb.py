@@ -0,0 +1,58 @@
+"""vacancy key_skills jsonb
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-15 02:19:44.102517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Смена типа переписывает таблицу под ACCESS EXCLUSIVE: применять в окно обслуживания
+    op.alter_column(
+        'vacancies',
+        'key_skills',
+        type_=postgresql.JSONB(),
+        existing_type=sa.JSON(),
+        postgresql_using='key_skills::jsonb',
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_vacancy_skills_gin',
+            'vacancies',
+            ['key_skills'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={'key_skills': 'jsonb_path_ops'},
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_vacancy_skills_gin',
+            table_name='vacancies',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.alter_column(
+        'vacancies',
+        'key_skills',
+        type_=sa.JSON(),
+        existing_type=postgresql.JSONB(),
+        postgresql_using='key_skills::json',
+    )
@@ -1,21 +1,26 @@
 """Companies API endpoints"""
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi_cache.decorator import cache
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.cache import query_key_builder
 from app.database import get_db
 from app.schemas import CompanyCreate, CompanyUpdate, Company
-from app.services.db_service import CompanyService
+from app.services.batch_loader import BatchLoader, get_company_loader
+from app.utils.etag import is_not_modified, make_etag
+from app.services.db_service import company_service
 
 router = APIRouter()
 
 
-@router.get("/", response_model=List[Company])
+@router.get("/", response_model=List[Company], response_model_exclude_none=True, response_model_exclude_unset=True)
+@cache(expire=15, key_builder=query_key_builder)
 async def get_companies(
     skip: int = Query(0, ge=0, description="Number of records to skip"),
     limit: int = Query(100, ge=1, le=1000, description="Number of records to return"),
     hh_id: Optional[str] = Query(None, description="Filter by HH.ru company ID"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> List[Company]:
     """
     Get list of companies with optional filters
@@ -25,35 +30,62 @@ async def get_companies(
     - limit: Maximum number of records to return
     - hh_id: Filter by HH.ru company ID
     """
-    company_service = CompanyService()
-    return company_service.get_all(db, skip=skip, limit=limit)
+    companies = await company_service.get_all(db, skip=skip, limit=limit)
+    return [Company.model_validate(c) for c in companies]
 
 
 @router.get("/{company_id}", response_model=Company)
 async def get_company(
     company_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db)
 ) -> Company:
     """
     Get specific company by ID
     
     Parameters:
     - company_id: Internal database ID of the company
+    
+    Supports conditional requests: responds 304 when If-None-Match matches the ETag
     """
-    company_service = CompanyService()
-    company = company_service.get(db, company_id)
+    company = await company_service.get(db, company_id)
     if not company:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Company with id {company_id} not found"
         )
+    
+    etag = make_etag(company.id, company.updated_at)
+    if is_not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return company
 
 
+@router.head("/{company_id}")
+async def check_company_exists(
+    company_id: int,
+    db: AsyncSession = Depends(get_db)
+) -> Response:
+    """
+    Check that a company exists without fetching it
+    
+    Parameters:
+    - company_id: Internal database ID of the company
+    """
+    if not await company_service.exists(db, company_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Company with id {company_id} not found"
+        )
+    return Response(status_code=status.HTTP_200_OK)
+
+
 @router.get("/hh/{hh_id}", response_model=Company)
 async def get_company_by_hh_id(
     hh_id: str,
-    db: Session = Depends(get_db)
+    company_loader: BatchLoader = Depends(get_company_loader)
 ) -> Company:
     """
     Get specific company by HH.ru ID
@@ -61,8 +93,7 @@ async def get_company_by_hh_id(
     Parameters:
     - hh_id: HH.ru company ID
     """
-    company_service = CompanyService()
-    company = company_service.get_by_hh_id(db, hh_id)
+    company = await company_loader.load(hh_id)
     if not company:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -74,7 +105,7 @@ async def get_company_by_hh_id(
 @router.post("/", response_model=Company, status_code=status.HTTP_201_CREATED)
 async def create_company(
     company: CompanyCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Company:
     """
     Create a new company
@@ -82,15 +113,14 @@ async def create_company(
     Parameters:
     - company: Company data
     """
-    company_service = CompanyService()
-    return company_service.create(db, company)
+    return await company_service.create(db, company)
 
 
 @router.put("/{company_id}", response_model=Company)
 async def update_company(
     company_id: int,
     company_update: CompanyUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Company:
     """
     Update an existing company
@@ -99,8 +129,7 @@ async def update_company(
     - company_id: Internal database ID of the company
     - company_update: Updated company data
     """
-    company_service = CompanyService()
-    company = company_service.update(db, company_id, company_update)
+    company = await company_service.update(db, company_id, company_update)
     if not company:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -112,7 +141,7 @@ async def update_company(
 @router.delete("/{company_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_company(
     company_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Delete a company
@@ -120,8 +149,7 @@ async def delete_company(
     Parameters:
     - company_id: Internal database ID of the company
     """
-    company_service = CompanyService()
-    success = company_service.delete(db, company_id)
+    success = await company_service.delete(db, company_id)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
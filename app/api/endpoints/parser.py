@@ -1,12 +1,14 @@
 """Parser API endpoints"""
-from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, status
-from sqlalchemy.orm import Session
+from typing import AsyncIterator, List, Optional, Dict, Any
+import orjson
+from celery.result import AsyncResult
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 
-from app.database import get_db
 from app.schemas import ParsingRange
-from app.services.hh_parser import HHParser
-from app.services.db_service import VacancyService, CompanyService
+from app.services.hh_parser import HHParser, get_hh_parser
+from app.tasks import celery, parse_and_save_task
 
 router = APIRouter()
 
@@ -14,50 +16,71 @@ router = APIRouter()
 @router.post("/parse/", status_code=status.HTTP_202_ACCEPTED)
 async def parse_vacancies(
     keywords: List[str],
-    regions: Optional[List[int]] = None,
-    background_tasks: BackgroundTasks = None,
-    db: Session = Depends(get_db)
+    regions: Optional[List[int]] = None
 ) -> Dict[str, Any]:
     """
-    Start parsing vacancies from HH.ru based on keywords and regions
+    Queue parsing of vacancies from HH.ru based on keywords and regions
     
     Parameters:
     - keywords: List of keywords to search for
     - regions: List of region IDs (optional)
-    - background_tasks: FastAPI background tasks
-    - db: Database session
     
     Returns:
-    - Status message with parsing information
+    - Celery task ID to poll via GET /parser/tasks/{task_id}
     """
-    parser = HHParser()
-    
-    # Get initial stats
     try:
-        stats = parser.parse_and_save(
-            keywords=keywords,
-            regions=regions,
-            params={}
+        task = await run_in_threadpool(parse_and_save_task.delay, keywords, regions, {})
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to queue parsing: {str(e)}"
         )
-        
-        return {
-            "status": "completed",
-            "message": "Parsing completed successfully",
-            "stats": stats
-        }
+    
+    return {
+        "task_id": task.id,
+        "status": "queued"
+    }
+
+
+@router.get("/tasks/{task_id}", response_model=Dict[str, Any])
+async def get_parse_task(
+    task_id: str
+) -> Dict[str, Any]:
+    """
+    Get state of a queued parsing task
+    
+    Parameters:
+    - task_id: Celery task ID returned by POST /parser/parse/
+    
+    Returns:
+    - Task state and parsing stats once finished
+    """
+    def _fetch_state() -> Dict[str, Any]:
+        result = AsyncResult(task_id, app=celery)
+        state = result.state
+        payload: Dict[str, Any] = {"task_id": task_id, "status": state, "result": None}
+        if state == "SUCCESS":
+            payload["result"] = result.result
+        elif state == "FAILURE":
+            payload["error"] = str(result.result)
+        return payload
+    
+    try:
+        return await run_in_threadpool(_fetch_state)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Parsing failed: {str(e)}"
+            detail=f"Failed to get task state: {str(e)}"
         )
 
 
-@router.get("/search/", response_model=List[Dict[str, Any]])
+@router.get("/search/")
 async def search_vacancies(
     keywords: List[str],
     regions: Optional[List[int]] = None,
-    params: Optional[Dict[str, Any]] = None
-) -> List[Dict[str, Any]]:
+    params: Optional[Dict[str, Any]] = None,
+    parser: HHParser = Depends(get_hh_parser)
+) -> StreamingResponse:
     """
     Search vacancies from HH.ru without saving to database
     
@@ -67,27 +90,19 @@ async def search_vacancies(
     - params: Additional search parameters (optional)
     
     Returns:
-    - List of found vacancies
+    - NDJSON stream of found vacancies, one per line, sent page by page
     """
-    parser = HHParser()
+    async def _lines() -> AsyncIterator[bytes]:
+        async for page in parser.iter_vacancies(keywords=keywords, regions=regions, **(params or {})):
+            yield b"".join(orjson.dumps(v) + b"\n" for v in page)
     
-    try:
-        vacancies = parser.search_vacancies(
-            keywords=keywords,
-            regions=regions,
-            params=params or {}
-        )
-        return vacancies
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Search failed: {str(e)}"
-        )
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
 
 
 @router.get("/vacancy/{vacancy_id}", response_model=Dict[str, Any])
 async def get_vacancy_details(
-    vacancy_id: str
+    vacancy_id: str,
+    parser: HHParser = Depends(get_hh_parser)
 ) -> Dict[str, Any]:
     """
     Get detailed information about a specific vacancy from HH.ru
@@ -98,10 +113,8 @@ async def get_vacancy_details(
     Returns:
     - Detailed vacancy information
     """
-    parser = HHParser()
-    
     try:
-        vacancy_details = parser.get_vacancy_details(vacancy_id)
+        vacancy_details = await parser.get_vacancy_details(vacancy_id)
         if not vacancy_details:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -119,7 +132,8 @@ async def get_vacancy_details(
 
 @router.get("/company/{company_id}", response_model=Dict[str, Any])
 async def get_company_info(
-    company_id: str
+    company_id: str,
+    parser: HHParser = Depends(get_hh_parser)
 ) -> Dict[str, Any]:
     """
     Get company information from HH.ru
@@ -130,10 +144,8 @@ async def get_company_info(
     Returns:
     - Company information
     """
-    parser = HHParser()
-    
     try:
-        company_info = parser._parse_company({"id": company_id})
+        company_info = await parser.get_employer(company_id)
         if not company_info:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -2,17 +2,29 @@
 Vacancies API endpoints
 Эндпоинты для работы с вакансиями
 """
-from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Any, Tuple
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from fastapi_cache.decorator import cache
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from app.database import get_db
+from app.core.cache import query_key_builder
+from app.database import get_db, get_session_factory
 from app.schemas import (
+    AnalyticsStatsResponse,
+    VacancyListItem,
+    VacancyListResponse,
     VacancyResponse,
     VacancyCreate,
     VacancyUpdate,
 )
-from app.services.db_service import VacancyService
+from app.services.batch_loader import BatchLoader, get_vacancy_loader
+from app.utils.dates import to_naive_utc
+from app.utils.etag import is_not_modified, make_etag
+from app.services.db_service import analytics_service, vacancy_service
 
 router = APIRouter()
 
@@ -20,15 +32,37 @@ router = APIRouter()
 # VACANCY ENDPOINTS
 # ============================================================================
 
-@router.get("/", response_model=Dict[str, Any])
+def _parse_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """Курсор keyset-пагинации: "<published_at ISO>,<id>" (дата пустая у вакансий без published_at).
+    Дата со смещением приводится к UTC без пояса, как хранится published_at"""
+    published_at, _, last_id = cursor.rpartition(",")
+    try:
+        return (to_naive_utc(datetime.fromisoformat(published_at)) if published_at else None), int(last_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid cursor: {cursor}"
+        )
+
+
+def _next_cursor(vacancies: List[Any], limit: int) -> Optional[str]:
+    if len(vacancies) < limit:
+        return None
+    last = vacancies[-1]
+    return f"{last.published_at.isoformat() if last.published_at else ''},{last.id}"
+
+
+@router.get("/", response_model=VacancyListResponse, response_model_exclude_none=True, response_model_exclude_unset=True)
+@cache(expire=15, key_builder=query_key_builder)
 async def get_vacancies(
     page: int = Query(1, ge=1, description="Page number (starts from 1)"),
     limit: int = Query(20, ge=1, le=100, description="Items per page"),
     hh_id: Optional[str] = Query(None, description="Filter by HH.ru vacancy ID"),
     company_id: Optional[int] = Query(None, description="Filter by company ID"),
     status: Optional[str] = Query(None, description="Filter by vacancy status"),
-    db: Session = Depends(get_db)
-) -> Dict[str, Any]:
+    cursor: Optional[str] = Query(None, description="Keyset pagination cursor (next_cursor of the previous page)"),
+    db: AsyncSession = Depends(get_db)
+) -> VacancyListResponse:
     """
     Get list of vacancies with pagination
     
@@ -38,21 +72,31 @@ async def get_vacancies(
     - hh_id: Filter by HH.ru vacancy ID
     - company_id: Filter by company ID
     - status: Filter by vacancy status
+    - cursor: Keyset pagination cursor "<published_at>,<id>"; when set, page is ignored
     
     Returns:
-    - items: List of vacancies
-    - total: Total count of vacancies
-    - page: Current page
+    - items: List of vacancies (newest published first)
+    - total: Total count of vacancies (absent for cursor requests)
+    - page: Current page (absent for cursor requests)
     - limit: Items per page
-    - pages: Total number of pages
+    - pages: Total number of pages (absent for cursor requests)
+    - next_cursor: Cursor for the next page, absent on the last one
     """
-    vacancy_service = VacancyService()
+    if cursor is not None:
+        # Глубокие страницы без OFFSET и без count(*): стоимость не растет с глубиной,
+        # total и pages клиент берет из первой (offset) страницы
+        vacancies = await vacancy_service.get_page_keyset(db, _parse_cursor(cursor), limit=limit, status=status, company_id=company_id)
+        return {
+            "items": [VacancyListItem.model_validate(v) for v in vacancies],
+            "limit": limit,
+            "next_cursor": _next_cursor(vacancies, limit)
+        }
     
     # Calculate skip
     skip = (page - 1) * limit
     
-    # Get vacancies
-    vacancies = vacancy_service.get_all(
+    # Get vacancies and total count in a single query
+    vacancies, total = await vacancy_service.get_all_with_total(
         db, 
         skip=skip, 
         limit=limit,
@@ -60,34 +104,60 @@ async def get_vacancies(
         company_id=company_id
     )
     
-    # Get total count
-    total = vacancy_service.count(db, status=status, company_id=company_id)
-    
     # Calculate total pages
     total_pages = (total + limit - 1) // limit
     
+    # Порядок тот же, что у keyset-выборки: с любой страницы можно перейти на курсор
     return {
-        "items": vacancies,
+        "items": [VacancyListItem.model_validate(v) for v in vacancies],
         "total": total,
         "page": page,
         "limit": limit,
-        "pages": total_pages
+        "pages": total_pages,
+        "next_cursor": _next_cursor(vacancies, limit)
     }
 
 
+@router.get("/export/")
+async def export_vacancies(
+    company_id: Optional[int] = Query(None, description="Filter by company ID"),
+    status: Optional[str] = Query(None, description="Filter by vacancy status"),
+    region: Optional[str] = Query(None, description="Filter by region"),
+    session_factory: async_sessionmaker = Depends(get_session_factory)
+) -> StreamingResponse:
+    """
+    Export all matching vacancies as NDJSON, one vacancy per line
+    
+    Parameters:
+    - company_id: Filter by company ID
+    - status: Filter by vacancy status
+    - region: Filter by region
+    """
+    async def _lines() -> AsyncIterator[bytes]:
+        # Своя сессия: зависимость get_db закрывается до окончания отправки потока
+        async with session_factory() as db:
+            async for vacancy in vacancy_service.stream(db, status=status, region=region, company_id=company_id):
+                yield orjson.dumps(VacancyResponse.model_validate(vacancy).model_dump()) + b"\n"
+    
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+
 @router.get("/{vacancy_id}", response_model=VacancyResponse)
 async def get_vacancy(
     vacancy_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db)
 ) -> VacancyResponse:
     """
     Get specific vacancy by ID
     
     Parameters:
     - vacancy_id: Internal database ID of the vacancy
+    
+    Supports conditional requests: responds 304 when If-None-Match matches the ETag
     """
-    vacancy_service = VacancyService()
-    vacancy = vacancy_service.get(db, vacancy_id)
+    vacancy = await vacancy_service.get(db, vacancy_id)
     
     if not vacancy:
         raise HTTPException(
@@ -95,13 +165,38 @@ async def get_vacancy(
             detail=f"Vacancy with id {vacancy_id} not found"
         )
     
+    # last_checked_at обновляется парсером без изменения updated_at, company входит в ответ
+    company_updated_at = vacancy.company.updated_at if vacancy.company else None
+    etag = make_etag(vacancy.id, vacancy.updated_at, vacancy.last_checked_at, company_updated_at)
+    if is_not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return vacancy
 
 
+@router.head("/{vacancy_id}")
+async def check_vacancy_exists(
+    vacancy_id: int,
+    db: AsyncSession = Depends(get_db)
+) -> Response:
+    """
+    Check that a vacancy exists without fetching it
+    
+    Parameters:
+    - vacancy_id: Internal database ID of the vacancy
+    """
+    if not await vacancy_service.exists(db, vacancy_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Vacancy with id {vacancy_id} not found"
+        )
+    return Response(status_code=status.HTTP_200_OK)
+
+
 @router.get("/hh/{hh_id}", response_model=VacancyResponse)
 async def get_vacancy_by_hh_id(
     hh_id: str,
-    db: Session = Depends(get_db)
+    vacancy_loader: BatchLoader = Depends(get_vacancy_loader)
 ) -> VacancyResponse:
     """
     Get specific vacancy by HH.ru ID
@@ -109,8 +204,7 @@ async def get_vacancy_by_hh_id(
     Parameters:
     - hh_id: HH.ru vacancy ID
     """
-    vacancy_service = VacancyService()
-    vacancy = vacancy_service.get_by_hh_id(db, hh_id)
+    vacancy = await vacancy_loader.load(hh_id)
     
     if not vacancy:
         raise HTTPException(
@@ -124,7 +218,7 @@ async def get_vacancy_by_hh_id(
 @router.post("/", response_model=VacancyResponse, status_code=status.HTTP_201_CREATED)
 async def create_vacancy(
     vacancy: VacancyCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> VacancyResponse:
     """
     Create a new vacancy
@@ -132,18 +226,20 @@ async def create_vacancy(
     Parameters:
     - vacancy: Vacancy data
     """
-    vacancy_service = VacancyService()
-    
-    # Проверяем, не существует ли уже вакансия с таким hh_id
-    existing = vacancy_service.get_by_hh_id(db, vacancy.hh_id)
-    if existing:
+    # Уникальность hh_id гарантирует индекс БД, без предварительного SELECT
+    try:
+        return await vacancy_service.create(db, vacancy)
+    except IntegrityError as e:
+        await db.rollback()
+        if await vacancy_service.exists_by_hh_id(db, vacancy.hh_id):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Vacancy with HH.ru ID {vacancy.hh_id} already exists"
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Vacancy with HH.ru ID {vacancy.hh_id} already exists"
+            detail=f"Failed to create vacancy: {str(e.orig)}"
         )
-    
-    try:
-        return vacancy_service.create(db, vacancy)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -155,7 +251,7 @@ async def create_vacancy(
 async def update_vacancy(
     vacancy_id: int,
     vacancy_update: VacancyUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> VacancyResponse:
     """
     Update an existing vacancy
@@ -164,8 +260,7 @@ async def update_vacancy(
     - vacancy_id: Internal database ID of the vacancy
     - vacancy_update: Updated vacancy data
     """
-    vacancy_service = VacancyService()
-    vacancy = vacancy_service.update(db, vacancy_id, vacancy_update)
+    vacancy = await vacancy_service.update(db, vacancy_id, vacancy_update)
     
     if not vacancy:
         raise HTTPException(
@@ -179,7 +274,7 @@ async def update_vacancy(
 @router.delete("/{vacancy_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_vacancy(
     vacancy_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Delete a vacancy
@@ -187,8 +282,7 @@ async def delete_vacancy(
     Parameters:
     - vacancy_id: Internal database ID of the vacancy
     """
-    vacancy_service = VacancyService()
-    success = vacancy_service.delete(db, vacancy_id)
+    success = await vacancy_service.delete(db, vacancy_id)
     
     if not success:
         raise HTTPException(
@@ -204,17 +298,24 @@ async def delete_vacancy(
 # ============================================================================
 
 @router.get("/stats/summary")
-async def get_vacancies_summary(db: Session = Depends(get_db)):
+@cache(expire=60, key_builder=query_key_builder)
+async def get_vacancies_summary(db: AsyncSession = Depends(get_db)):
     """
     Get summary statistics about vacancies
     """
-    vacancy_service = VacancyService()
-    
-    total = vacancy_service.count(db)
-    active = vacancy_service.count(db, status="active")
+    total, active = await vacancy_service.summary_counts(db)
     
     return {
         "total_vacancies": total,
         "active_vacancies": active,
         "archived_vacancies": total - active
     }
+
+
+@router.get("/stats/overall", response_model=AnalyticsStatsResponse)
+async def get_vacancies_overall_stats(db: AsyncSession = Depends(get_db)):
+    """
+    Get overall statistics: vacancy and company counts, top regions, salary ranges
+    """
+    # Кеш в Redis на стороне сервиса: парсер сбрасывает его после записи каждой пачки
+    return await analytics_service.calculate_overall_stats(db)
@@ -0,0 +1,56 @@
+"""
+Кеширование ответов API в Redis (fastapi-cache2)
+"""
+import hashlib
+from typing import Any, Callable, Dict, Optional, Tuple
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+from redis import asyncio as aioredis
+from starlette.requests import Request
+from starlette.responses import Response
+from config import settings
+
+CACHE_PREFIX = "hh"
+
+_redis: Optional[aioredis.Redis] = None
+
+
+def get_redis() -> aioredis.Redis:
+    """Общий async-клиент Redis процесса"""
+    global _redis
+    if _redis is None:
+        _redis = aioredis.from_url(settings.REDIS_URL)
+    return _redis
+
+
+def query_key_builder(
+    func: Callable[..., Any],
+    namespace: str = "",
+    *,
+    request: Optional[Request] = None,
+    response: Optional[Response] = None,
+    args: Tuple[Any, ...] = (),
+    kwargs: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Ключ кеша по параметрам запроса эндпоинта.
+
+    Сессия БД (`db`) в ключ не попадает: её repr уникален для каждого
+    запроса, и стандартный key builder никогда не давал бы попаданий.
+    """
+    params = sorted((name, value) for name, value in (kwargs or {}).items() if name != "db")
+    digest = hashlib.md5(repr(params).encode()).hexdigest()
+    return f"{FastAPICache.get_prefix()}:{namespace}:{func.__module__}.{func.__name__}:{digest}"
+
+
+def init_cache() -> None:
+    """Инициализация fastapi-cache с Redis backend"""
+    FastAPICache.init(RedisBackend(get_redis()), prefix=CACHE_PREFIX)
+
+
+async def close_cache() -> None:
+    """Закрытие соединений с Redis"""
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
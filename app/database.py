@@ -1,56 +1,121 @@
 """
 Управление подключением к базе данных
 """
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
-from contextlib import contextmanager
-from typing import Generator
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from uuid import uuid4
 from config import settings
 from app.models import Base
 
-# Создание engine с базовыми настройками
-engine = create_engine(
-    settings.DATABASE_URL,
+
+def _async_database_url(url: str) -> str:
+    """Подменяет синхронный драйвер PostgreSQL на asyncpg"""
+    db_url = make_url(url)
+    if db_url.drivername in ("postgresql", "postgresql+psycopg2"):
+        db_url = db_url.set(drivername="postgresql+asyncpg")
+    return db_url.render_as_string(hide_password=False)
+
+
+def _engine_options(url: str) -> dict:
+    """Настройки пула; SQLite (тесты, локальный запуск) работает без пула соединений"""
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    options = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,  # Ожидание свободного соединения, сек
+        "pool_recycle": settings.DB_POOL_RECYCLE,  # Переоткрывать соединения старше N секунд
+        "pool_use_lifo": settings.DB_POOL_USE_LIFO,  # Отдавать последнее возвращенное (теплое) соединение
+    }
+    if settings.DB_PGBOUNCER:
+        # PgBouncer (pool_mode=transaction) не сохраняет prepared statements asyncpg между транзакциями
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        }
+    return options
+
+
+# Создание async engine с настройками пула
+engine = create_async_engine(
+    _async_database_url(settings.DATABASE_URL),
     pool_pre_ping=True,  # Проверка соединения перед использованием
-    echo=False  # Логирование SQL запросов
+    # Bulk INSERT ... RETURNING уходит пачками по DB_INSERT_PAGE_SIZE строк в одном VALUES:
+    # 10 000 строк - 10 запросов вместо 10 000. Executemany без RETURNING asyncpg отправляет
+    # одним prepared statement конвейером (аналог executemany_mode='values_plus_batch' у psycopg2)
+    insertmanyvalues_page_size=settings.DB_INSERT_PAGE_SIZE,
+    echo=settings.DB_ECHO,  # Логирование SQL запросов
+    **_engine_options(settings.DATABASE_URL)
 )
 
+
+def enable_sqlite_foreign_keys(async_engine: AsyncEngine) -> None:
+    """
+    Удаление компаний и вакансий - Core DELETE, каскад выполняет ON DELETE CASCADE в БД.
+    SQLite проверяет внешние ключи только с PRAGMA foreign_keys=ON на каждом соединении
+    """
+    if async_engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _set_foreign_keys(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+enable_sqlite_foreign_keys(engine)
+
 # Session factory
-SessionLocal = sessionmaker(
-    autocommit=False,
+AsyncSessionLocal = async_sessionmaker(
+    engine,
     autoflush=False,
-    bind=engine
+    expire_on_commit=False
 )
 
-def get_db() -> Generator[Session, None, None]:
+def get_session_factory() -> async_sessionmaker:
     """
-    Dependency для получения сессии БД в FastAPI endpoints
+    Dependency для кода, которому нужна своя сессия вне запроса (стриминг, DataLoader).
+    Переопределяется в тестах вместе с get_db
     """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    return AsyncSessionLocal
 
-@contextmanager
-def get_db_context():
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """
+    Dependency для получения сессии БД в FastAPI endpoints.
+    Один запрос - одна транзакция: commit после эндпоинта, rollback при ошибке
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+@asynccontextmanager
+async def get_db_context() -> AsyncIterator[AsyncSession]:
     """
     Context manager для использования вне FastAPI
     """
-    db = SessionLocal()
-    try:
-        yield db
-        db.commit()
-    except Exception:
-        db.rollback()
-        raise
-    finally:
-        db.close()
-
-def init_db():
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+async def init_db():
     """Создание всех таблиц"""
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
 
-def drop_db():
+async def drop_db():
     """Удаление всех таблиц"""
-    Base.metadata.drop_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
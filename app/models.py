@@ -1,21 +1,30 @@
 """
 SQLAlchemy модели для HH Parser Service
 """
-from datetime import datetime
 from sqlalchemy import (
     Column, Integer, String, Text, DateTime, Boolean, 
-    ForeignKey, JSON, Index, UniqueConstraint
+    ForeignKey, JSON, Index, DDL, event
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import column, func, table, text
 
 Base = declarative_base()
 
+# JSON-колонки объявлены без MutableList/MutableDict: flush не сравнивает их содержимое.
+# Изменения в месте (obj.key_skills.append(...)) не сохраняются - присваивайте новое значение целиком
+
+# Полнотекстовый поиск по вакансиям (PostgreSQL). Запросы должны использовать выражение дословно,
+# иначе планировщик не сопоставит его с GIN-индексом ix_vacancy_search_vec
+VACANCY_SEARCH_VECTOR = "to_tsvector('russian', coalesce(title, '') || ' ' || coalesce(description, ''))"
+
 
 class Company(Base):
     """Модель компании-работодателя"""
     __tablename__ = 'companies'
+    # created_at/updated_at возвращаются в RETURNING того же INSERT/UPDATE, без refresh
+    __mapper_args__ = {'eager_defaults': True}
     
     id = Column(Integer, primary_key=True, index=True)
     hh_id = Column(String(50), unique=True, nullable=False, index=True)
@@ -38,6 +47,7 @@ class Company(Base):
 class Vacancy(Base):
     """Модель вакансии"""
     __tablename__ = 'vacancies'
+    __mapper_args__ = {'eager_defaults': True}
     
     id = Column(Integer, primary_key=True, index=True)
     hh_id = Column(String(50), unique=True, nullable=False, index=True)
@@ -46,7 +56,7 @@ class Vacancy(Base):
     
     # Описание и требования
     description = Column(Text)
-    key_skills = Column(JSON)  # ["Python", "FastAPI", ...]
+    key_skills = Column(JSON().with_variant(JSONB(), 'postgresql'))  # ["Python", "FastAPI", ...]
     experience = Column(String(100))  # "От 1 до 3 лет"
     employment = Column(String(50))   # "Полная занятость"
     schedule = Column(String(50))     # "Полный день"
@@ -79,13 +89,40 @@ class Vacancy(Base):
     # Indexes
     __table_args__ = (
         Index('ix_vacancy_company_status', 'company_id', 'status'),
-        Index('ix_vacancy_published', 'published_at', 'status'),
+        # Порядок списка и keyset-пагинация: (published_at DESC NULLS LAST, id DESC)
+        Index('ix_vacancy_published_id', published_at.desc().nulls_last(), id.desc(), 'status').ddl_if(dialect='postgresql'),
+        # Фильтры списка (status, company_id)
+        Index('ix_vacancies_status_company', 'status', 'company_id', id.desc()),
+        Index('ix_vacancy_search_vec', text(VACANCY_SEARCH_VECTOR), postgresql_using='gin').ddl_if(dialect='postgresql'),
+        # VacancyService.search: experience + ORDER BY published_at DESC, зарплата проверяется по INCLUDE-колонкам
+        Index('ix_vac_search_multi', 'experience', published_at.desc(), postgresql_include=['salary_from', 'salary_to']),
+        # Большинство вакансий без зарплаты: NULL-строки в индекс не попадают
+        Index('ix_vac_salary_from', 'salary_from', postgresql_where=text('salary_from IS NOT NULL')),
+        # Поиск по навыку: key_skills @> '["Python"]'
+        Index('ix_vacancy_skills_gin', 'key_skills', postgresql_using='gin', postgresql_ops={'key_skills': 'jsonb_path_ops'}).ddl_if(dialect='postgresql'),
     )
     
     def __repr__(self):
         return f"<Vacancy(id={self.id}, title='{self.title}', status='{self.status}')>"
 
 
+# Активные вакансии по регионам (PostgreSQL): статистика читает десяток строк вместо GROUP BY по vacancies.
+# Обновляется REFRESH MATERIALIZED VIEW CONCURRENTLY (нужен уникальный индекс) после каждого парсинга
+# и задачей hh.refresh_region_counts по расписанию Celery Beat
+vacancy_region_counts = table('vacancy_region_counts', column('region'), column('n'))
+
+event.listen(Vacancy.__table__, 'after_create', DDL(
+    "CREATE MATERIALIZED VIEW IF NOT EXISTS vacancy_region_counts AS "
+    "SELECT region, count(*) AS n FROM vacancies WHERE status = 'active' AND region IS NOT NULL GROUP BY region"
+).execute_if(dialect='postgresql'))
+event.listen(Vacancy.__table__, 'after_create', DDL(
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_vacancy_region_counts_region ON vacancy_region_counts (region)"
+).execute_if(dialect='postgresql'))
+event.listen(Vacancy.__table__, 'before_drop', DDL(
+    "DROP MATERIALIZED VIEW IF EXISTS vacancy_region_counts"
+).execute_if(dialect='postgresql'))
+
+
 class VacancyVersion(Base):
     """История изменений вакансии"""
     __tablename__ = 'vacancy_versions'
@@ -122,6 +159,7 @@ class VacancyVersion(Base):
 class SearchFilter(Base):
     """Фильтр поиска вакансий"""
     __tablename__ = 'search_filters'
+    __mapper_args__ = {'eager_defaults': True}
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(200), nullable=False, unique=True)
@@ -152,6 +190,7 @@ class SearchFilter(Base):
 class ParsingTask(Base):
     """Задача парсинга"""
     __tablename__ = 'parsing_tasks'
+    __mapper_args__ = {'eager_defaults': True}
     
     id = Column(Integer, primary_key=True, index=True)
     filter_id = Column(Integer, ForeignKey('search_filters.id', ondelete='CASCADE'))
@@ -3,7 +3,7 @@ Pydantic схемы для валидации данных API
 """
 from typing import Optional, List, Dict, Any
 from datetime import datetime
-from pydantic import BaseModel, Field, HttpUrl, validator
+from pydantic import BaseModel, ConfigDict, Field
 
 
 # ============================================================================
@@ -37,8 +37,7 @@ class CompanyResponse(CompanyBase):
     created_at: datetime
     updated_at: Optional[datetime]
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ============================================================================
@@ -96,17 +95,44 @@ class VacancyResponse(VacancyBase):
     updated_at: Optional[datetime]
     last_checked_at: Optional[datetime]
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+class VacancyListItem(BaseModel):
+    """Вакансия в списке: без тяжелых текстовых полей (description, address)"""
+    id: int
+    hh_id: str
+    title: str
+    company_id: int
+    company: Optional[CompanyResponse] = None
+    key_skills: Optional[List[str]] = None
+    experience: Optional[str] = None
+    employment: Optional[str] = None
+    schedule: Optional[str] = None
+    salary_from: Optional[int] = None
+    salary_to: Optional[int] = None
+    salary_currency: Optional[str] = None
+    salary_gross: Optional[bool] = None
+    region: Optional[str] = None
+    city: Optional[str] = None
+    url: Optional[str] = None
+    status: str
+    published_at: Optional[datetime] = None
+    created_at: datetime
+    updated_at: Optional[datetime]
+    last_checked_at: Optional[datetime]
+    
+    model_config = ConfigDict(from_attributes=True)
 
 
 class VacancyListResponse(BaseModel):
     """Схема списка вакансий с пагинацией"""
-    items: List[VacancyResponse]
-    total: int
-    page: int
-    page_size: int
-    pages: int
+    items: List[VacancyListItem]
+    total: Optional[int] = Field(None, description="Всего вакансий; не считается для запросов с cursor")
+    page: Optional[int] = None
+    limit: int
+    pages: Optional[int] = None
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы: \"<published_at>,<id>\"")
 
 
 # ============================================================================
@@ -149,8 +175,7 @@ class SearchFilterResponse(SearchFilterBase):
     updated_at: Optional[datetime]
     last_run_at: Optional[datetime]
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ============================================================================
@@ -172,8 +197,7 @@ class ParsingTaskResponse(BaseModel):
     started_at: Optional[datetime]
     completed_at: Optional[datetime]
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ParsingTaskCreate(BaseModel):
@@ -201,8 +225,7 @@ class AnalyticsDailyResponse(BaseModel):
     median_salary: Optional[int]
     created_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class AnalyticsStatsResponse(BaseModel):
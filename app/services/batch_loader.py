@@ -0,0 +1,89 @@
+"""
+Склейка конкурентных выборок по hh_id в один запрос (DataLoader)
+"""
+import asyncio
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, Generic, List, Optional, TypeVar
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from app.database import get_session_factory
+from app.models import Company, Vacancy
+from app.services.db_service import company_service, vacancy_service
+
+T = TypeVar("T")
+
+
+class BatchLoader(Generic[T]):
+    """
+    Ключи, запрошенные конкурентными корутинами в течение окна `delay`,
+    загружаются одним запросом `WHERE key IN (...)` в отдельной сессии.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[AsyncSession, List[str]], Awaitable[Dict[str, T]]],
+        session_factory: async_sessionmaker,
+        delay: float = 0.005,
+    ):
+        self.batch_fn = batch_fn
+        self.delay = delay
+        self.session_factory = session_factory
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self, key: str) -> Optional[T]:
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = future
+            if self._task is None:
+                self._task = asyncio.create_task(self._drain())
+                self._task.add_done_callback(self._drain_done)
+        # shield: отмена одного запроса не должна отменять общий future остальных ожидающих
+        return await asyncio.shield(future)
+
+    async def _drain(self):
+        batch: Dict[str, asyncio.Future] = {}
+        try:
+            await asyncio.sleep(self.delay)
+            batch, self._pending, self._task = self._pending, {}, None
+            async with self.session_factory() as db:
+                found = await self.batch_fn(db, list(batch))
+            for key, future in batch.items():
+                if not future.done():
+                    future.set_result(found.get(key))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            # Отмена во время запроса (остановка цикла, shutdown) не должна оставлять ожидающих навсегда
+            for future in batch.values():
+                future.cancel()
+
+    def _drain_done(self, task: asyncio.Task):
+        # _drain отменен до сбора пачки (возможно, не успев начаться): отменяем накопленные ключи
+        # и освобождаем место для следующего _drain
+        if self._task is task:
+            pending, self._pending, self._task = self._pending, {}, None
+            for future in pending.values():
+                future.cancel()
+
+
+# Один загрузчик на фабрику сессий: запросы процесса склеиваются, а фабрику задает DI (и его overrides в тестах)
+@lru_cache(maxsize=None)
+def _vacancy_loader(session_factory: async_sessionmaker) -> BatchLoader[Vacancy]:
+    return BatchLoader(vacancy_service.get_many_by_hh_ids, session_factory)
+
+
+@lru_cache(maxsize=None)
+def _company_loader(session_factory: async_sessionmaker) -> BatchLoader[Company]:
+    return BatchLoader(company_service.get_many_by_hh_ids, session_factory)
+
+
+def get_vacancy_loader(session_factory: async_sessionmaker = Depends(get_session_factory)) -> BatchLoader[Vacancy]:
+    return _vacancy_loader(session_factory)
+
+
+def get_company_loader(session_factory: async_sessionmaker = Depends(get_session_factory)) -> BatchLoader[Company]:
+    return _company_loader(session_factory)
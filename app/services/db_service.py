@@ -1,209 +1,473 @@
 """Database Service - CRUD operations"""
-from typing import List, Optional, Dict, Any
+import logging
+from typing import AsyncIterator, List, Optional, Dict, Any, Tuple
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_, desc
-from app.models import Company, Vacancy, VacancyVersion, SearchFilter, ParsingTask, ParsingLog, AnalyticsDaily
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import String, select, insert, update, delete, func, and_, or_, desc, tuple_, cast, literal, literal_column, bindparam, lambda_stmt, case, text
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import joinedload, load_only, raiseload, selectinload
+import orjson
+from app.core.cache import CACHE_PREFIX, get_redis
+from app.models import Company, Vacancy, VacancyVersion, SearchFilter, ParsingTask, ParsingLog, AnalyticsDaily, VACANCY_SEARCH_VECTOR, vacancy_region_counts
 from app.schemas import CompanyCreate, CompanyUpdate, VacancyCreate, VacancyUpdate, SearchFilterCreate, SearchFilterUpdate
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Методы сервисов не коммитят: транзакцией управляет вызывающий (get_db в API, get_db_context в задачах)
+
+# С какого OFFSET список без фильтров берет total из статистики PostgreSQL, а не из count(*)
+ESTIMATED_TOTAL_SKIP = 10000
+
+# Общая статистика: агрегаты по всей таблице vacancies пересчитываются не чаще раза в TTL
+OVERALL_STATS_KEY = f"{CACHE_PREFIX}:stats:overall"
+OVERALL_STATS_TTL = 60
+
+# DB_RAISELOAD: любая ленивая загрузка связей в списках падает сразу, а не превращается в N+1
+_strict_loading = (raiseload("*"),) if settings.DB_RAISELOAD else ()
+
+# Порядок списка вакансий; совпадает с ix_vacancy_published_id и с курсором get_page_keyset
+_list_order = (Vacancy.published_at.desc().nulls_last(), Vacancy.id.desc())
+
+# Списки не читают description/address (multi-KB Text, TOAST): их грузит только карточка вакансии
+_list_columns = load_only(
+    Vacancy.id, Vacancy.hh_id, Vacancy.title, Vacancy.company_id, Vacancy.key_skills, Vacancy.experience,
+    Vacancy.employment, Vacancy.schedule, Vacancy.salary_from, Vacancy.salary_to, Vacancy.salary_currency,
+    Vacancy.salary_gross, Vacancy.region, Vacancy.city, Vacancy.url, Vacancy.status, Vacancy.published_at,
+    Vacancy.created_at, Vacancy.updated_at, Vacancy.last_checked_at,
+)
+
+# Горячие выборки по id/hh_id: SQL компилируется один раз и берется из кеша statement'ов
+_company_by_id_stmt = lambda_stmt(lambda: select(Company).where(Company.id == bindparam("id")))
+_vacancy_by_id_stmt = lambda_stmt(lambda: select(Vacancy).options(joinedload(Vacancy.company)).where(Vacancy.id == bindparam("id")))
+_filter_by_id_stmt = lambda_stmt(lambda: select(SearchFilter).where(SearchFilter.id == bindparam("id")))
+_task_by_id_stmt = lambda_stmt(lambda: select(ParsingTask).where(ParsingTask.id == bindparam("id")))
+_company_by_hh_id_stmt = lambda_stmt(lambda: select(Company).where(Company.hh_id == bindparam("hh_id")))
+_vacancy_by_hh_id_stmt = lambda_stmt(lambda: select(Vacancy).options(joinedload(Vacancy.company)).where(Vacancy.hh_id == bindparam("hh_id")))
+
+async def _bulk_upsert(db: AsyncSession, model, rows: List[Dict[str, Any]], untracked: Tuple[str, ...] = ()) -> Dict[str, int]:
+    # INSERT ... ON CONFLICT (hh_id) DO UPDATE по колонкам строк, возвращает {hh_id: id}.
+    # updated_at сдвигается, только если хотя бы одна отслеживаемая колонка IS DISTINCT FROM новой.
+    # Тот же ON CONFLICT есть в SQLite, на котором идут тесты
+    insert_ = sqlite_insert if db.bind.dialect.name == "sqlite" else pg_insert
+    stmt = insert_(model).values(rows)
+    columns = [name for name in rows[0] if name not in ("id", "hh_id", "created_at", "updated_at")]
+    changed = or_(*[getattr(model, name).is_distinct_from(stmt.excluded[name]) for name in columns if name not in untracked])
+    set_ = {name: stmt.excluded[name] for name in columns}
+    set_["updated_at"] = case((changed, func.now()), else_=model.updated_at)
+    stmt = stmt.on_conflict_do_update(index_elements=[model.hh_id], set_=set_).returning(model.hh_id, model.id)
+    return {hh_id: row_id for hh_id, row_id in (await db.execute(stmt)).all()}
 
 class CompanyService:
     @staticmethod
-    def get(db: Session, company_id: int) -> Optional[Company]:
-        return db.query(Company).filter(Company.id == company_id).first()
-    
+    async def get(db: AsyncSession, company_id: int) -> Optional[Company]:
+        return (await db.execute(_company_by_id_stmt, {"id": company_id})).scalar_one_or_none()
+
     @staticmethod
-    def get_by_hh_id(db: Session, hh_id: str) -> Optional[Company]:
-        return db.query(Company).filter(Company.hh_id == hh_id).first()
-    
+    async def exists(db: AsyncSession, company_id: int) -> bool:
+        stmt = select(literal(1)).where(Company.id == company_id).limit(1)
+        return (await db.execute(stmt)).first() is not None
+
     @staticmethod
-    def get_all(db: Session, skip: int = 0, limit: int = 100) -> List[Company]:
-        return db.query(Company).offset(skip).limit(limit).all()
-    
+    async def get_by_hh_id(db: AsyncSession, hh_id: str) -> Optional[Company]:
+        return (await db.execute(_company_by_hh_id_stmt, {"hh_id": hh_id})).scalar_one_or_none()
+
     @staticmethod
-    def create(db: Session, company: CompanyCreate) -> Company:
-        db_company = Company(**company.dict())
+    async def get_many_by_hh_ids(db: AsyncSession, hh_ids: List[str]) -> Dict[str, Company]:
+        companies = (await db.execute(select(Company).where(Company.hh_id.in_(hh_ids)))).scalars()
+        return {c.hh_id: c for c in companies}
+
+    @staticmethod
+    async def get_all(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[Company]:
+        return list((await db.execute(select(Company).offset(skip).limit(limit))).scalars().all())
+
+    @staticmethod
+    async def create(db: AsyncSession, company: CompanyCreate) -> Company:
+        db_company = Company(**company.model_dump())
         db.add(db_company)
-        db.commit()
-        db.refresh(db_company)
+        await db.flush()
         return db_company
-    
+
     @staticmethod
-    def update(db: Session, company_id: int, company_update: CompanyUpdate) -> Optional[Company]:
-        db_company = CompanyService.get(db, company_id)
+    async def bulk_upsert(db: AsyncSession, rows: List[Dict[str, Any]]) -> Dict[str, int]:
+        # INSERT ... ON CONFLICT (hh_id) DO UPDATE вместо SELECT + INSERT на каждого работодателя; коммит за вызывающим
+        if not rows:
+            return {}
+        return await _bulk_upsert(db, Company, rows)
+
+    @staticmethod
+    async def update(db: AsyncSession, company_id: int, company_update: CompanyUpdate) -> Optional[Company]:
+        db_company = await CompanyService.get(db, company_id)
         if not db_company:
             return None
-        update_data = company_update.dict(exclude_unset=True)
+        update_data = company_update.model_dump(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_company, field, value)
-        db_company.updated_at = datetime.now()
-        db.commit()
-        db.refresh(db_company)
+        await db.flush()
         return db_company
 
+    @staticmethod
+    async def delete(db: AsyncSession, company_id: int) -> bool:
+        result = await db.execute(delete(Company).where(Company.id == company_id))
+        return result.rowcount > 0
+
 class VacancyService:
     @staticmethod
-    def get(db: Session, vacancy_id: int) -> Optional[Vacancy]:
-        return db.query(Vacancy).filter(Vacancy.id == vacancy_id).first()
-    
+    async def get(db: AsyncSession, vacancy_id: int) -> Optional[Vacancy]:
+        return (await db.execute(_vacancy_by_id_stmt, {"id": vacancy_id})).scalar_one_or_none()
+
     @staticmethod
-    def get_by_hh_id(db: Session, hh_id: str) -> Optional[Vacancy]:
-        return db.query(Vacancy).filter(Vacancy.hh_id == hh_id).first()
-    
+    async def exists(db: AsyncSession, vacancy_id: int) -> bool:
+        stmt = select(literal(1)).where(Vacancy.id == vacancy_id).limit(1)
+        return (await db.execute(stmt)).first() is not None
+
     @staticmethod
-    def get_all(db: Session, skip: int = 0, limit: int = 100, status: Optional[str] = None, region: Optional[str] = None, company_id: Optional[int] = None) -> List[Vacancy]:
-        query = db.query(Vacancy)
+    async def get_by_hh_id(db: AsyncSession, hh_id: str) -> Optional[Vacancy]:
+        return (await db.execute(_vacancy_by_hh_id_stmt, {"hh_id": hh_id})).scalar_one_or_none()
+
+    @staticmethod
+    async def get_many_by_hh_ids(db: AsyncSession, hh_ids: List[str]) -> Dict[str, Vacancy]:
+        stmt = select(Vacancy).options(joinedload(Vacancy.company)).where(Vacancy.hh_id.in_(hh_ids))
+        return {v.hh_id: v for v in (await db.execute(stmt)).scalars()}
+
+    @staticmethod
+    async def exists_by_hh_id(db: AsyncSession, hh_id: str) -> bool:
+        stmt = select(literal(1)).where(Vacancy.hh_id == hh_id).limit(1)
+        return (await db.execute(stmt)).first() is not None
+
+    @staticmethod
+    def _list_filters(status: Optional[str] = None, region: Optional[str] = None, company_id: Optional[int] = None) -> List[Any]:
+        conds = []
         if status:
-            query = query.filter(Vacancy.status == status)
+            conds.append(Vacancy.status == status)
         if region:
-            query = query.filter(Vacancy.region == region)
+            conds.append(Vacancy.region == region)
         if company_id:
-            query = query.filter(Vacancy.company_id == company_id)
-        return query.order_by(desc(Vacancy.published_at)).offset(skip).limit(limit).all()
-    
+            conds.append(Vacancy.company_id == company_id)
+        return conds
+
+    @staticmethod
+    async def get_all(db: AsyncSession, skip: int = 0, limit: int = 100, status: Optional[str] = None, region: Optional[str] = None, company_id: Optional[int] = None, load_company: bool = True) -> List[Vacancy]:
+        conds = VacancyService._list_filters(status=status, region=region, company_id=company_id)
+        stmt = select(Vacancy).options(_list_columns, *_strict_loading).where(*conds).order_by(*_list_order).offset(skip).limit(limit)
+        if load_company:
+            stmt = stmt.options(selectinload(Vacancy.company))
+        return list((await db.execute(stmt)).scalars().all())
+
+    @staticmethod
+    async def get_all_with_total(db: AsyncSession, skip: int = 0, limit: int = 100, status: Optional[str] = None, region: Optional[str] = None, company_id: Optional[int] = None, load_company: bool = True) -> Tuple[List[Vacancy], int]:
+        conds = VacancyService._list_filters(status=status, region=region, company_id=company_id)
+        if skip > ESTIMATED_TOTAL_SKIP and not conds and db.bind.dialect.name == "postgresql":
+            # Глубокие страницы без фильтров: точный count(*) по всей таблице заменяет оценка планировщика
+            total = await VacancyService.estimated_total(db)
+            if total is not None:
+                return await VacancyService.get_all(db, skip=skip, limit=limit, load_company=load_company), total
+        stmt = select(Vacancy, func.count().over().label("total")).options(_list_columns, *_strict_loading).where(*conds).order_by(*_list_order).offset(skip).limit(limit)
+        if load_company:
+            stmt = stmt.options(selectinload(Vacancy.company))
+        rows = (await db.execute(stmt)).all()
+        if rows:
+            return [row[0] for row in rows], rows[0].total
+        if skip == 0:
+            return [], 0
+        # Страница за концом выборки: окну не на чем посчитать total
+        return [], await VacancyService.count(db, status=status, region=region, company_id=company_id)
+
     @staticmethod
-    def search(db: Session, keywords: Optional[List[str]] = None, min_salary: Optional[int] = None, max_salary: Optional[int] = None, experience: Optional[str] = None, skip: int = 0, limit: int = 100) -> List[Vacancy]:
-        query = db.query(Vacancy)
-        if keywords:
+    async def get_page_keyset(db: AsyncSession, cursor: Optional[Tuple[Optional[datetime], int]], limit: int = 100, status: Optional[str] = None, region: Optional[str] = None, company_id: Optional[int] = None) -> List[Vacancy]:
+        # Keyset-пагинация: WHERE (published_at, id) < (:last_pub, :last_id) вместо OFFSET — индекс сразу встает на курсор
+        conds = VacancyService._list_filters(status=status, region=region, company_id=company_id)
+        if cursor is not None:
+            last_pub, last_id = cursor
+            if last_pub is None:
+                # Курсор уже в хвосте без даты публикации (NULLS LAST)
+                conds.append(and_(Vacancy.published_at.is_(None), Vacancy.id < last_id))
+            else:
+                conds.append(or_(tuple_(Vacancy.published_at, Vacancy.id) < tuple_(last_pub, last_id), Vacancy.published_at.is_(None)))
+        stmt = select(Vacancy).options(_list_columns, selectinload(Vacancy.company), *_strict_loading).where(*conds).order_by(*_list_order).limit(limit)
+        return list((await db.execute(stmt)).scalars().all())
+
+    @staticmethod
+    async def stream(db: AsyncSession, status: Optional[str] = None, region: Optional[str] = None, company_id: Optional[int] = None) -> AsyncIterator[Vacancy]:
+        stmt = select(Vacancy).options(joinedload(Vacancy.company), *_strict_loading).where(*VacancyService._list_filters(status, region, company_id)).order_by(Vacancy.id)
+        result = await db.stream_scalars(stmt.execution_options(yield_per=200))
+        async for vacancy in result:
+            yield vacancy
+
+    @staticmethod
+    async def search(db: AsyncSession, keywords: Optional[List[str]] = None, min_salary: Optional[int] = None, max_salary: Optional[int] = None, experience: Optional[str] = None, skip: int = 0, limit: int = 100) -> List[Vacancy]:
+        stmt = select(Vacancy).options(_list_columns, selectinload(Vacancy.company), *_strict_loading)
+        order_by = [desc(Vacancy.published_at)]
+        if keywords and db.bind.dialect.name == "postgresql":
+            # Любое из ключевых слов (фразой) через GIN-индекс, релевантные выше
+            search_vector = literal_column(VACANCY_SEARCH_VECTOR)
+            phrases = " or ".join('"%s"' % kw.replace('"', '') for kw in keywords)
+            query = func.websearch_to_tsquery("russian", phrases)
+            stmt = stmt.where(search_vector.op("@@")(query))
+            order_by.insert(0, desc(func.ts_rank(search_vector, query)))
+        elif keywords:
             keyword_filter = or_(*[Vacancy.title.ilike(f"%{kw}%") for kw in keywords], *[Vacancy.description.ilike(f"%{kw}%") for kw in keywords])
-            query = query.filter(keyword_filter)
+            stmt = stmt.where(keyword_filter)
         if min_salary:
-            query = query.filter(Vacancy.salary_from >= min_salary)
+            stmt = stmt.where(Vacancy.salary_from >= min_salary)
         if max_salary:
-            query = query.filter(Vacancy.salary_to <= max_salary)
+            stmt = stmt.where(Vacancy.salary_to <= max_salary)
         if experience:
-            query = query.filter(Vacancy.experience == experience)
-        return query.order_by(desc(Vacancy.published_at)).offset(skip).limit(limit).all()
-    
+            stmt = stmt.where(Vacancy.experience == experience)
+        stmt = stmt.order_by(*order_by).offset(skip).limit(limit)
+        return list((await db.execute(stmt)).scalars().all())
+
     @staticmethod
-    def count(db: Session, status: Optional[str] = None) -> int:
-        query = db.query(func.count(Vacancy.id))
-        if status:
-            query = query.filter(Vacancy.status == status)
-        return query.scalar()
-    
+    async def filter_by_skill(db: AsyncSession, skill: str, skip: int = 0, limit: int = 100) -> List[Vacancy]:
+        if db.bind.dialect.name == "postgresql":
+            # JSONB @> по GIN-индексу ix_vacancy_skills_gin (jsonb_path_ops)
+            skill_filter = Vacancy.key_skills.op("@>")(literal([skill], JSONB))
+        else:
+            skill_filter = cast(Vacancy.key_skills, String).like(f'%"{skill}"%')
+        stmt = select(Vacancy).options(_list_columns, selectinload(Vacancy.company), *_strict_loading).where(skill_filter).order_by(*_list_order).offset(skip).limit(limit)
+        return list((await db.execute(stmt)).scalars().all())
+
+    @staticmethod
+    async def count(db: AsyncSession, status: Optional[str] = None, company_id: Optional[int] = None, region: Optional[str] = None) -> int:
+        stmt = select(func.count(Vacancy.id)).where(*VacancyService._list_filters(status=status, region=region, company_id=company_id))
+        return (await db.execute(stmt)).scalar_one()
+
+    @staticmethod
+    async def estimated_total(db: AsyncSession) -> Optional[int]:
+        # pg_class.reltuples обновляют ANALYZE/autovacuum; -1 — таблица еще не анализировалась
+        stmt = text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'vacancies'::regclass")
+        estimate = (await db.execute(stmt)).scalar_one_or_none()
+        return estimate if estimate is not None and estimate >= 0 else None
+
     @staticmethod
-    def get_history(db: Session, vacancy_id: int) -> List[VacancyVersion]:
-        return db.query(VacancyVersion).filter(VacancyVersion.vacancy_id == vacancy_id).order_by(desc(VacancyVersion.created_at)).all()
+    async def summary_counts(db: AsyncSession) -> Tuple[int, int]:
+        stmt = select(func.count().label("total"), func.count().filter(Vacancy.status == "active").label("active")).select_from(Vacancy)
+        row = (await db.execute(stmt)).one()
+        return row.total, row.active
+
+    @staticmethod
+    async def create(db: AsyncSession, vacancy: VacancyCreate) -> Vacancy:
+        db_vacancy = Vacancy(**vacancy.model_dump())
+        db.add(db_vacancy)
+        await db.flush()
+        return await VacancyService.get(db, db_vacancy.id)
+
+    @staticmethod
+    async def bulk_upsert(db: AsyncSession, rows: List[Dict[str, Any]]) -> Dict[str, int]:
+        # Один INSERT ... ON CONFLICT (hh_id) DO UPDATE на пачку; коммит остается за вызывающим
+        if not rows:
+            return {}
+        # last_checked_at меняется при каждом прогоне и изменением вакансии не считается
+        return await _bulk_upsert(db, Vacancy, rows, untracked=("last_checked_at",))
+
+    @staticmethod
+    async def update(db: AsyncSession, vacancy_id: int, vacancy_update: VacancyUpdate) -> Optional[Vacancy]:
+        db_vacancy = await VacancyService.get(db, vacancy_id)
+        if not db_vacancy:
+            return None
+        update_data = vacancy_update.model_dump(exclude_unset=True)
+        for field, value in update_data.items():
+            setattr(db_vacancy, field, value)
+        await db.flush()
+        return db_vacancy
+
+    @staticmethod
+    async def delete(db: AsyncSession, vacancy_id: int) -> bool:
+        result = await db.execute(delete(Vacancy).where(Vacancy.id == vacancy_id))
+        return result.rowcount > 0
+
+    @staticmethod
+    async def get_history(db: AsyncSession, vacancy_id: int) -> List[VacancyVersion]:
+        stmt = select(VacancyVersion).where(VacancyVersion.vacancy_id == vacancy_id).order_by(desc(VacancyVersion.created_at))
+        return list((await db.execute(stmt)).scalars().all())
+
+class VacancyVersionService:
+    @staticmethod
+    async def bulk_create(db: AsyncSession, versions: List[Dict[str, Any]]) -> None:
+        if not versions:
+            return
+        await db.execute(insert(VacancyVersion), versions)
 
 class SearchFilterService:
     @staticmethod
-    def get(db: Session, filter_id: int) -> Optional[SearchFilter]:
-        return db.query(SearchFilter).filter(SearchFilter.id == filter_id).first()
-    
+    async def get(db: AsyncSession, filter_id: int) -> Optional[SearchFilter]:
+        return (await db.execute(_filter_by_id_stmt, {"id": filter_id})).scalar_one_or_none()
+
+    @staticmethod
+    async def exists(db: AsyncSession, filter_id: int) -> bool:
+        stmt = select(literal(1)).where(SearchFilter.id == filter_id).limit(1)
+        return (await db.execute(stmt)).first() is not None
+
     @staticmethod
-    def get_all(db: Session, enabled_only: bool = False) -> List[SearchFilter]:
-        query = db.query(SearchFilter)
+    async def get_all(db: AsyncSession, enabled_only: bool = False) -> List[SearchFilter]:
+        stmt = select(SearchFilter)
         if enabled_only:
-            query = query.filter(SearchFilter.enabled == True)
-        return query.all()
-    
+            stmt = stmt.where(SearchFilter.enabled == True)
+        return list((await db.execute(stmt)).scalars().all())
+
     @staticmethod
-    def create(db: Session, filter_data: SearchFilterCreate) -> SearchFilter:
-        db_filter = SearchFilter(**filter_data.dict())
+    async def create(db: AsyncSession, filter_data: SearchFilterCreate) -> SearchFilter:
+        db_filter = SearchFilter(**filter_data.model_dump())
         db.add(db_filter)
-        db.commit()
-        db.refresh(db_filter)
+        await db.flush()
         return db_filter
-    
+
     @staticmethod
-    def update(db: Session, filter_id: int, filter_update: SearchFilterUpdate) -> Optional[SearchFilter]:
-        db_filter = SearchFilterService.get(db, filter_id)
+    async def update(db: AsyncSession, filter_id: int, filter_update: SearchFilterUpdate) -> Optional[SearchFilter]:
+        db_filter = await SearchFilterService.get(db, filter_id)
         if not db_filter:
             return None
-        update_data = filter_update.dict(exclude_unset=True)
+        update_data = filter_update.model_dump(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_filter, field, value)
-        db_filter.updated_at = datetime.now()
-        db.commit()
-        db.refresh(db_filter)
+        await db.flush()
         return db_filter
-    
+
     @staticmethod
-    def delete(db: Session, filter_id: int) -> bool:
-        db_filter = SearchFilterService.get(db, filter_id)
-        if not db_filter:
-            return False
-        db.delete(db_filter)
-        db.commit()
-        return True
-    
-    @staticmethod
-    def update_last_run(db: Session, filter_id: int):
-        db_filter = SearchFilterService.get(db, filter_id)
-        if db_filter:
-            db_filter.last_run_at = datetime.now()
-            db.commit()
+    async def delete(db: AsyncSession, filter_id: int) -> bool:
+        result = await db.execute(delete(SearchFilter).where(SearchFilter.id == filter_id))
+        return result.rowcount > 0
+
+    @staticmethod
+    async def update_last_run(db: AsyncSession, filter_id: int):
+        # Один UPDATE без предварительного SELECT фильтра
+        await db.execute(update(SearchFilter).where(SearchFilter.id == filter_id).values(last_run_at=func.now()))
 
 class ParsingTaskService:
     @staticmethod
-    def get(db: Session, task_id: int) -> Optional[ParsingTask]:
-        return db.query(ParsingTask).filter(ParsingTask.id == task_id).first()
-    
+    async def get(db: AsyncSession, task_id: int) -> Optional[ParsingTask]:
+        return (await db.execute(_task_by_id_stmt, {"id": task_id})).scalar_one_or_none()
+
+    @staticmethod
+    async def exists(db: AsyncSession, task_id: int) -> bool:
+        stmt = select(literal(1)).where(ParsingTask.id == task_id).limit(1)
+        return (await db.execute(stmt)).first() is not None
+
     @staticmethod
-    def get_all(db: Session, status: Optional[str] = None, limit: int = 50) -> List[ParsingTask]:
-        query = db.query(ParsingTask)
+    async def get_all(db: AsyncSession, status: Optional[str] = None, limit: int = 50) -> List[ParsingTask]:
+        stmt = select(ParsingTask)
         if status:
-            query = query.filter(ParsingTask.status == status)
-        return query.order_by(desc(ParsingTask.created_at)).limit(limit).all()
-    
+            stmt = stmt.where(ParsingTask.status == status)
+        stmt = stmt.order_by(desc(ParsingTask.created_at)).limit(limit)
+        return list((await db.execute(stmt)).scalars().all())
+
     @staticmethod
-    def create(db: Session, filter_id: Optional[int] = None) -> ParsingTask:
+    async def create(db: AsyncSession, filter_id: Optional[int] = None) -> ParsingTask:
         task = ParsingTask(filter_id=filter_id, status="pending")
         db.add(task)
-        db.commit()
-        db.refresh(task)
+        await db.flush()
         return task
-    
+
     @staticmethod
-    def update_status(db: Session, task_id: int, status: str, **kwargs) -> Optional[ParsingTask]:
-        task = ParsingTaskService.get(db, task_id)
-        if not task:
-            return None
-        task.status = status
+    async def update_status(db: AsyncSession, task_id: int, status: str, **kwargs) -> Optional[ParsingTask]:
+        # Один UPDATE ... RETURNING: метки времени ставит БД и сразу возвращает, без SELECT до и refresh после
+        values = {key: value for key, value in kwargs.items() if key in ParsingTask.__table__.c}
+        values["status"] = status
         if status == "running":
-            task.started_at = datetime.now()
+            values["started_at"] = func.now()
         elif status in ["completed", "failed"]:
-            task.completed_at = datetime.now()
-        for key, value in kwargs.items():
-            if hasattr(task, key):
-                setattr(task, key, value)
-        db.commit()
-        db.refresh(task)
-        return task
-    
+            values["completed_at"] = func.now()
+        stmt = update(ParsingTask).where(ParsingTask.id == task_id).values(**values).returning(ParsingTask).execution_options(populate_existing=True)
+        return (await db.execute(stmt)).scalar_one_or_none()
+
     @staticmethod
-    def add_log(db: Session, task_id: int, level: str, message: str, details: Optional[Dict] = None):
-        log = ParsingLog(task_id=task_id, level=level, message=message, details=details)
-        db.add(log)
-        db.commit()
-    
+    async def add_log(db: AsyncSession, task_id: int, level: str, message: str, details: Optional[Dict] = None):
+        # Строка уходит в БД вместе с транзакцией вызывающего
+        db.add(ParsingLog(task_id=task_id, level=level, message=message, details=details))
+
     @staticmethod
-    def get_logs(db: Session, task_id: int) -> List[ParsingLog]:
-        return db.query(ParsingLog).filter(ParsingLog.task_id == task_id).order_by(ParsingLog.created_at).all()
+    async def get_logs(db: AsyncSession, task_id: int) -> List[ParsingLog]:
+        stmt = select(ParsingLog).where(ParsingLog.task_id == task_id).order_by(ParsingLog.created_at)
+        return list((await db.execute(stmt)).scalars().all())
 
 class AnalyticsService:
     @staticmethod
-    def get_daily_stats(db: Session, date: datetime) -> Optional[AnalyticsDaily]:
-        return db.query(AnalyticsDaily).filter(func.date(AnalyticsDaily.date) == date.date()).first()
-    
+    async def get_daily_stats(db: AsyncSession, date: datetime) -> Optional[AnalyticsDaily]:
+        stmt = select(AnalyticsDaily).where(func.date(AnalyticsDaily.date) == date.date())
+        return (await db.execute(stmt)).scalars().first()
+
+    @staticmethod
+    async def get_stats_range(db: AsyncSession, start_date: datetime, end_date: datetime) -> List[AnalyticsDaily]:
+        stmt = select(AnalyticsDaily).where(and_(AnalyticsDaily.date >= start_date, AnalyticsDaily.date <= end_date)).order_by(AnalyticsDaily.date)
+        return list((await db.execute(stmt)).scalars().all())
+
+    @staticmethod
+    async def calculate_overall_stats(db: AsyncSession) -> Dict[str, Any]:
+        # Redis недоступен - считаем из БД, статистика не должна падать вместе с кешем
+        try:
+            cached = await get_redis().get(OVERALL_STATS_KEY)
+        except Exception as e:
+            logger.warning(f"Error reading overall stats from cache: {e}")
+            cached = None
+        if cached:
+            return orjson.loads(cached)
+        stats = await AnalyticsService._compute_overall_stats(db)
+        try:
+            await get_redis().setex(OVERALL_STATS_KEY, OVERALL_STATS_TTL, orjson.dumps(stats))
+        except Exception as e:
+            logger.warning(f"Error writing overall stats to cache: {e}")
+        return stats
+
     @staticmethod
-    def get_stats_range(db: Session, start_date: datetime, end_date: datetime) -> List[AnalyticsDaily]:
-        return db.query(AnalyticsDaily).filter(and_(AnalyticsDaily.date >= start_date, AnalyticsDaily.date <= end_date)).order_by(AnalyticsDaily.date).all()
-    
+    async def top_regions(db: AsyncSession, limit: int = 10) -> List[Tuple[str, int]]:
+        # Незаполненное представление (CREATE ... WITH NO DATA, восстановление из дампа) не читается - считаем по vacancies
+        if db.bind.dialect.name == "postgresql" and await AnalyticsService._region_counts_populated(db):
+            stmt = select(vacancy_region_counts.c.region, vacancy_region_counts.c.n).order_by(desc(vacancy_region_counts.c.n)).limit(limit)
+        else:
+            stmt = select(Vacancy.region, func.count(Vacancy.id).label("n")).where(Vacancy.status == "active", Vacancy.region.isnot(None)).group_by(Vacancy.region).order_by(desc("n")).limit(limit)
+        return [(region, n) for region, n in (await db.execute(stmt)).all()]
+
+    @staticmethod
+    async def refresh_region_counts(db: AsyncSession) -> None:
+        # CONCURRENTLY не блокирует чтение статистики на время пересчета, но требует уже заполненного представления
+        if db.bind.dialect.name != "postgresql":
+            return
+        concurrently = "CONCURRENTLY " if await AnalyticsService._region_counts_populated(db) else ""
+        await db.execute(text(f"REFRESH MATERIALIZED VIEW {concurrently}vacancy_region_counts"))
+
     @staticmethod
-    def calculate_overall_stats(db: Session) -> Dict[str, Any]:
-        total_vacancies = db.query(func.count(Vacancy.id)).scalar()
-        active_vacancies = db.query(func.count(Vacancy.id)).filter(Vacancy.status == "active").scalar()
-        total_companies = db.query(func.count(Company.id)).scalar()
+    async def _region_counts_populated(db: AsyncSession) -> bool:
+        stmt = text("SELECT ispopulated FROM pg_matviews WHERE matviewname = 'vacancy_region_counts'")
+        return bool((await db.execute(stmt)).scalar_one_or_none())
+
+    @staticmethod
+    async def invalidate_overall_stats() -> None:
+        try:
+            await get_redis().delete(OVERALL_STATS_KEY)
+        except Exception as e:
+            logger.warning(f"Error invalidating overall stats cache: {e}")
+
+    @staticmethod
+    async def _compute_overall_stats(db: AsyncSession) -> Dict[str, Any]:
         now = datetime.now()
         today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
         week_ago = now - timedelta(days=7)
         month_ago = now - timedelta(days=30)
-        vacancies_today = db.query(func.count(Vacancy.id)).filter(Vacancy.created_at >= today_start).scalar()
-        vacancies_week = db.query(func.count(Vacancy.id)).filter(Vacancy.created_at >= week_ago).scalar()
-        vacancies_month = db.query(func.count(Vacancy.id)).filter(Vacancy.created_at >= month_ago).scalar()
-        top_regions = db.query(Vacancy.region, func.count(Vacancy.id).label("count")).filter(Vacancy.region.isnot(None)).group_by(Vacancy.region).order_by(desc("count")).limit(10).all()
-        salary_stats = db.query(func.avg(Vacancy.salary_from).label("avg_from"), func.avg(Vacancy.salary_to).label("avg_to"), func.min(Vacancy.salary_from).label("min_from"), func.max(Vacancy.salary_to).label("max_to")).filter(Vacancy.salary_from.isnot(None)).first()
-        return {"total_vacancies": total_vacancies, "active_vacancies": active_vacancies, "total_companies": total_companies, "vacancies_today": vacancies_today, "vacancies_week": vacancies_week, "vacancies_month": vacancies_month, "top_keywords": [], "top_regions": [{"region": r[0], "count": r[1]} for r in top_regions], "salary_stats": {"avg_from": float(salary_stats.avg_from) if salary_stats.avg_from else None, "avg_to": float(salary_stats.avg_to) if salary_stats.avg_to else None, "min_from": salary_stats.min_from, "max_to": salary_stats.max_to} if salary_stats else {}}
+        # Все счетчики и зарплатная статистика за один проход по vacancies
+        has_salary = Vacancy.salary_from.isnot(None)
+        stmt = select(
+            func.count().label("total"),
+            func.count().filter(Vacancy.status == "active").label("active"),
+            func.count().filter(Vacancy.created_at >= today_start).label("today"),
+            func.count().filter(Vacancy.created_at >= week_ago).label("week"),
+            func.count().filter(Vacancy.created_at >= month_ago).label("month"),
+            select(func.count(Company.id)).scalar_subquery().label("companies"),
+            func.avg(Vacancy.salary_from).filter(has_salary).label("avg_from"),
+            func.avg(Vacancy.salary_to).filter(has_salary).label("avg_to"),
+            func.min(Vacancy.salary_from).filter(has_salary).label("min_from"),
+            func.max(Vacancy.salary_to).filter(has_salary).label("max_to"),
+        ).select_from(Vacancy)
+        stats = (await db.execute(stmt)).one()
+        top_regions = await AnalyticsService.top_regions(db)
+        return {"total_vacancies": stats.total, "active_vacancies": stats.active, "total_companies": stats.companies, "vacancies_today": stats.today, "vacancies_week": stats.week, "vacancies_month": stats.month, "top_keywords": [], "top_regions": [{"region": r[0], "count": r[1]} for r in top_regions], "salary_stats": {"avg_from": float(stats.avg_from) if stats.avg_from else None, "avg_to": float(stats.avg_to) if stats.avg_to else None, "min_from": stats.min_from, "max_to": stats.max_to}}
+
+# Сервисы не хранят состояния: один экземпляр на процесс
+company_service = CompanyService()
+vacancy_service = VacancyService()
+vacancy_version_service = VacancyVersionService()
+search_filter_service = SearchFilterService()
+parsing_task_service = ParsingTaskService()
+analytics_service = AnalyticsService()
 
 # КОНЕЦ ФАЙЛА db_service.py
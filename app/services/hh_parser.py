@@ -4,11 +4,16 @@ HH.ru Parser Service
 """
 import asyncio
 import aiohttp
-from typing import List, Dict, Optional, Any, Tuple
+import orjson
+from yarl import URL
+from typing import AsyncIterator, List, Dict, Optional, Any, Tuple
 from datetime import datetime
 import logging
-from sqlalchemy.orm import Session
-from app.models import Company, Vacancy, VacancyVersion
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Vacancy
+from app.services.db_service import analytics_service, company_service, vacancy_service, vacancy_version_service
+from app.utils.dates import to_naive_utc
 from config import settings
 
 logger = logging.getLogger(__name__)
@@ -26,6 +31,13 @@ class HHParser:
     REQUEST_DELAY = 0.35
     RETRY_ATTEMPTS = 3
     RETRY_DELAY = 2.0
+    BATCH_SIZE = 500
+    MAX_CONCURRENCY = settings.HH_CONN_LIMIT_PER_HOST
+    CONNECTION_LIMIT = settings.HH_CONN_LIMIT
+    KEEPALIVE_TIMEOUT = 60
+    DNS_CACHE_TTL = 300
+    # Колонки строки вакансии, изменение которых не пишется в историю
+    UNTRACKED_FIELDS = ("hh_id", "last_checked_at")
     
     EXPERIENCE_CODES = {
         "noExperience": "Нет опыта",
@@ -34,200 +46,367 @@ class HHParser:
         "moreThan6": "Более 6 лет"
     }
     
-    def __init__(self, db: Session, user_agent: Optional[str] = None):
+    def __init__(self, db: Optional[AsyncSession] = None, user_agent: Optional[str] = None):
         self.db = db
         self.user_agent = user_agent or f"{settings.APP_NAME}/1.0"
         self.headers = {
             "User-Agent": self.user_agent,
-            "Accept": "application/json"
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate"
         }
         self.session: Optional[aiohttp.ClientSession] = None
+        self._timeout = aiohttp.ClientTimeout(total=settings.HH_API_TIMEOUT)
+        self._semaphore = asyncio.Semaphore(self.MAX_CONCURRENCY)
     
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession(headers=self.headers)
+        self._get_session()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            # Keep-alive соединения и кеш DNS: TCP/TLS handshake не повторяется на каждый запрос
+            connector = aiohttp.TCPConnector(
+                limit=self.CONNECTION_LIMIT,
+                limit_per_host=self.MAX_CONCURRENCY,
+                keepalive_timeout=self.KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=self.DNS_CACHE_TTL,
+            )
+            self.session = aiohttp.ClientSession(headers=self.headers, connector=connector, timeout=self._timeout)
+        return self.session
+    
+    async def close(self):
         if self.session:
             await self.session.close()
+            self.session = None
     
-    async def _make_request(self, endpoint: str, params: Optional[Dict] = None, retry_count: int = 0) -> Dict[str, Any]:
-        if not self.session:
-            raise HHParserError("Session not initialized")
-        
-        url = f"{self.BASE_URL}{endpoint}"
+    async def _make_request(self, endpoint: str, params: Optional[Dict] = None) -> Dict[str, Any]:
+        return await self._get_json(URL(f"{self.BASE_URL}{endpoint}"), params)
+    
+    async def _get_json(self, url: URL, params: Optional[Dict] = None) -> Dict[str, Any]:
+        session = self._get_session()
+        for attempt in range(self.RETRY_ATTEMPTS + 1):
+            last_attempt = attempt == self.RETRY_ATTEMPTS
+            try:
+                async with session.get(url, params=params) as response:
+                    if response.status == 429:
+                        if last_attempt:
+                            raise HHRateLimitError("Rate limit exceeded")
+                        delay = self._retry_after(response, attempt)
+                    elif response.status != 200:
+                        raise HHParserError(f"API returned {response.status}")
+                    else:
+                        # Байты сразу в orjson: без декодирования в str, которое делает response.json()
+                        try:
+                            return orjson.loads(await response.read())
+                        except orjson.JSONDecodeError as e:
+                            raise HHParserError(f"Invalid JSON: {e}")
+            except asyncio.TimeoutError:
+                if last_attempt:
+                    raise HHParserError("Timeout")
+                delay = self.RETRY_DELAY * 2 ** attempt
+            except aiohttp.ClientError as e:
+                if last_attempt:
+                    raise HHParserError(f"Network error: {e}")
+                delay = self.RETRY_DELAY * 2 ** attempt
+            # Пауза вне async with: соединение уже вернулось в пул
+            await asyncio.sleep(delay)
+        raise HHParserError("Retry attempts exhausted")
+    
+    def _retry_after(self, response: aiohttp.ClientResponse, retry_count: int) -> float:
+        """Пауза перед повтором после 429: Retry-After от API или экспоненциальный backoff"""
         try:
-            async with self.session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                if response.status == 429:
-                    if retry_count < self.RETRY_ATTEMPTS:
-                        await asyncio.sleep(self.RETRY_DELAY * (retry_count + 1))
-                        return await self._make_request(endpoint, params, retry_count + 1)
-                    raise HHRateLimitError("Rate limit exceeded")
-                
-                if response.status != 200:
-                    raise HHParserError(f"API returned {response.status}")
-                
-                return await response.json()
-        except asyncio.TimeoutError:
-            if retry_count < self.RETRY_ATTEMPTS:
-                await asyncio.sleep(self.RETRY_DELAY)
-                return await self._make_request(endpoint, params, retry_count + 1)
-            raise HHParserError("Timeout")
-        except aiohttp.ClientError as e:
-            if retry_count < self.RETRY_ATTEMPTS:
-                await asyncio.sleep(self.RETRY_DELAY)
-                return await self._make_request(endpoint, params, retry_count + 1)
-            raise HHParserError(f"Network error: {e}")
+            return float(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            return self.RETRY_DELAY * 2 ** retry_count
     
-    async def search_vacancies(self, keywords: List[str], regions: Optional[List[int]] = None, **kwargs) -> List[Dict]:
-        all_vacancies = []
+    async def _fetch_page(self, search_url: URL, page: int) -> Optional[Dict[str, Any]]:
+        try:
+            async with self._semaphore:
+                data = await self._get_json(search_url.update_query(page=page))
+                await asyncio.sleep(self.REQUEST_DELAY)
+            return data
+        except HHParserError as e:
+            logger.error(f"Ошибка: {e}")
+            return None
+    
+    async def iter_vacancies(self, keywords: List[str], regions: Optional[List[int]] = None, **kwargs) -> AsyncIterator[List[Dict]]:
+        """Постранично отдает найденные вакансии, отбрасывая дубли между страницами и ключевыми словами"""
+        seen = set()
         for keyword in keywords:
             logger.info(f"Поиск: '{keyword}'")
-            params = {"text": keyword, "per_page": self.VACANCIES_PER_PAGE, "page": 0, "period": 30}
+            params = {"text": keyword, "per_page": self.VACANCIES_PER_PAGE, "period": 30}
             if regions:
-                params["area"] = regions[0] if len(regions) == 1 else regions
+                params["area"] = regions
+            # Query string кодируется один раз на ключевое слово, страницы только дописывают page
+            search_url = URL(f"{self.BASE_URL}/vacancies").with_query(params)
             
-            page = 0
-            while page < self.MAX_PAGES:
-                params["page"] = page
-                try:
-                    data = await self._make_request("/vacancies", params)
-                    vacancies = data.get("items", [])
-                    if not vacancies:
-                        break
-                    all_vacancies.extend(vacancies)
-                    if page >= data.get("pages", 1) - 1:
-                        break
-                    page += 1
-                    await asyncio.sleep(self.REQUEST_DELAY)
-                except HHParserError as e:
-                    logger.error(f"Ошибка: {e}")
-                    break
-        
-        unique = {v["id"]: v for v in all_vacancies}.values()
-        return list(unique)
+            # Первая страница сообщает число страниц, остальные запрашиваются параллельно под общим семафором
+            first = await self._fetch_page(search_url, 0)
+            if not first:
+                continue
+            rest = range(1, min(first.get("pages", 1), self.MAX_PAGES))
+            for data in [first, *await asyncio.gather(*(self._fetch_page(search_url, page) for page in rest))]:
+                if not data:
+                    continue
+                fresh = [v for v in data.get("items", []) if v["id"] not in seen]
+                seen.update(v["id"] for v in fresh)
+                if fresh:
+                    yield fresh
+    
+    async def search_vacancies(self, keywords: List[str], regions: Optional[List[int]] = None, **kwargs) -> List[Dict]:
+        return [v async for page in self.iter_vacancies(keywords, regions, **kwargs) for v in page]
     
     async def get_vacancy_details(self, vacancy_id: str) -> Optional[Dict]:
+        """Детали вакансии; одновременные запросы одного id из любых парсеров процесса ждут один HTTP-запрос"""
+        key = (asyncio.get_running_loop(), vacancy_id)
+        request = _inflight.get(key)
+        if request is None:
+            request = _inflight[key] = _InflightRequest(asyncio.create_task(self._fetch_vacancy_details(vacancy_id)))
+            request.task.add_done_callback(lambda _: _forget_inflight(key, request))
+        request.waiters += 1
+        try:
+            # shield: отмена одного ожидающего не отменяет запрос для остальных
+            return await asyncio.shield(request.task)
+        finally:
+            request.waiters -= 1
+            # Последний ожидающий ушел (например, parse_and_save отменил запросы) - HTTP-запрос больше не нужен
+            if not request.waiters and not request.task.done():
+                _forget_inflight(key, request)
+                request.task.cancel()
+    
+    async def _fetch_vacancy_details(self, vacancy_id: str) -> Optional[Dict]:
         try:
-            details = await self._make_request(f"/vacancies/{vacancy_id}")
-            await asyncio.sleep(self.REQUEST_DELAY)
+            async with self._semaphore:
+                details = await self._make_request(f"/vacancies/{vacancy_id}")
+                await asyncio.sleep(self.REQUEST_DELAY)
             return details
         except HHParserError:
             return None
 
-    def _parse_company(self, company_data: Optional[Dict]) -> Optional[Company]:
+    async def get_employer(self, employer_id: str) -> Optional[Dict]:
+        try:
+            return await self._make_request(f"/employers/{employer_id}")
+        except HHParserError:
+            return None
+
+    def _company_row(self, company_data: Optional[Dict]) -> Optional[Dict[str, Any]]:
         if not company_data or not company_data.get("id"):
             return None
         
-        company = self.db.query(Company).filter(Company.hh_id == str(company_data["id"])).first()
-        if company:
-            company.name = company_data.get("name", company.name)
-            company.updated_at = datetime.now()
-        else:
-            company = Company(
-                hh_id=str(company_data["id"]),
-                name=company_data.get("name", "Неизвестно"),
-                url=company_data.get("alternate_url")
-            )
-            self.db.add(company)
-        self.db.flush()
-        return company
+        return {
+            "hh_id": str(company_data["id"]),
+            "name": company_data.get("name", "Неизвестно"),
+            "url": company_data.get("alternate_url")
+        }
     
-    def _parse_vacancy(self, vac_data: Dict, company: Company) -> Tuple[Vacancy, bool]:
-        v_id = vac_data.get("id")
-        existing = self.db.query(Vacancy).filter(Vacancy.hh_id == str(v_id)).first()
-        
+    def _vacancy_row(self, vac_data: Dict, company_id: Optional[int] = None, now: Optional[datetime] = None) -> Dict[str, Any]:
         salary = vac_data.get("salary")
-        skills = [s.get("name") for s in vac_data.get("key_skills", []) if s.get("name")]
+        # Одна проверка salary вместо четырех: HH отдает null для вакансий без зарплаты
+        if salary:
+            salary_fields = (salary.get("from"), salary.get("to"), salary.get("currency"), salary.get("gross"))
+        else:
+            salary_fields = (None, None, None, None)
+        skills = [name for name in (s.get("name") for s in vac_data.get("key_skills") or ()) if name]
+        # fromisoformat в 3.11 написан на C и сам разбирает "+0300" и "Z" из HH;
+        # published_at - колонка без пояса, поэтому дата приводится к UTC
         pub_at = None
-        if "published_at" in vac_data:
+        published_at = vac_data.get("published_at")
+        if published_at:
             try:
-                pub_at = datetime.fromisoformat(vac_data["published_at"].replace("Z", "+00:00"))
-            except:
+                pub_at = to_naive_utc(datetime.fromisoformat(published_at))
+            except (ValueError, TypeError):
                 pass
         
-        if not existing:
-            vacancy = Vacancy(
-                hh_id=str(v_id),
-                company_id=company.id,
-                title=vac_data.get("name", "Без названия"),
-                description=vac_data.get("description"),
-                key_skills=skills,
-                experience=self.EXPERIENCE_CODES.get(vac_data.get("experience", {}).get("id"), "Не указано"),
-                salary_from=salary.get("from") if salary else None,
-                salary_to=salary.get("to") if salary else None,
-                salary_currency=salary.get("currency") if salary else None,
-                salary_gross=salary.get("gross") if salary else None,
-                region=vac_data.get("area", {}).get("name"),
-                url=vac_data.get("alternate_url"),
-                status="active",
-                published_at=pub_at,
-                last_checked_at=datetime.now()
-            )
-            self.db.add(vacancy)
-            self.db.flush()
-            self._create_version(vacancy, "created", [])
-            return vacancy, True
-        else:
-            changed = []
-            if existing.title != vac_data.get("name"):
-                changed.append("title")
-                existing.title = vac_data.get("name", "")
-            existing.last_checked_at = datetime.now()
+        return {
+            "hh_id": str(vac_data.get("id")),
+            "company_id": company_id,
+            "title": vac_data.get("name", "Без названия"),
+            "description": vac_data.get("description"),
+            "key_skills": skills,
+            "experience": self.EXPERIENCE_CODES.get((vac_data.get("experience") or {}).get("id"), "Не указано"),
+            "salary_from": salary_fields[0],
+            "salary_to": salary_fields[1],
+            "salary_currency": salary_fields[2],
+            "salary_gross": salary_fields[3],
+            "region": (vac_data.get("area") or {}).get("name"),
+            "url": vac_data.get("alternate_url"),
+            "status": "active",
+            "published_at": pub_at,
+            "last_checked_at": now or datetime.now()
+        }
+    
+    def _version_row(self, vacancy_id: int, row: Dict[str, Any], change_type: str, fields: List[str]) -> Dict[str, Any]:
+        return {
+            "vacancy_id": vacancy_id,
+            "title": row["title"],
+            "description": row.get("description"),
+            "key_skills": row.get("key_skills"),
+            "salary_from": row.get("salary_from"),
+            "salary_to": row.get("salary_to"),
+            "status": row.get("status"),
+            "change_type": change_type,
+            "changed_fields": fields
+        }
+    
+    async def _persist_batch(self, rows: List[Dict[str, Any]], companies: Dict[str, Dict[str, Any]], employers: Dict[str, str]) -> Tuple[int, int]:
+        """Сохраняет пачку работодателей и вакансий двумя upsert без коммита. Возвращает (new, updated)"""
+        company_ids = await company_service.bulk_upsert(self.db, list(companies.values()))
+        for row in rows:
+            row["company_id"] = company_ids[employers[row["hh_id"]]]
+        
+        hh_ids = [row["hh_id"] for row in rows]
+        tracked = [name for name in rows[0] if name not in self.UNTRACKED_FIELDS]
+        stmt = select(Vacancy.hh_id, *(getattr(Vacancy, name) for name in tracked)).where(Vacancy.hh_id.in_(hh_ids))
+        existing = {hh_id: values for hh_id, *values in (await self.db.execute(stmt)).all()}
+        ids = await vacancy_service.bulk_upsert(self.db, rows)
+        
+        # История изменений пачки - один executemany INSERT, без ORM-объектов и unit of work.
+        # Изменением считаются те же колонки, по которым bulk_upsert сдвигает updated_at
+        versions = []
+        for row in rows:
+            if row["hh_id"] not in existing:
+                versions.append(self._version_row(ids[row["hh_id"]], row, "created", []))
+                continue
+            changed = [name for name, old in zip(tracked, existing[row["hh_id"]]) if old != row[name]]
             if changed:
-                self._create_version(existing, "updated", changed)
-                existing.updated_at = datetime.now()
-            return existing, False
-    
-    def _create_version(self, vacancy: Vacancy, change_type: str, fields: List[str]):
-        version = VacancyVersion(
-            vacancy_id=vacancy.id,
-            title=vacancy.title,
-            description=vacancy.description,
-            key_skills=vacancy.key_skills,
-            salary_from=vacancy.salary_from,
-            salary_to=vacancy.salary_to,
-            status=vacancy.status,
-            change_type=change_type,
-            changed_fields=fields
-        )
-        self.db.add(version)
+                versions.append(self._version_row(ids[row["hh_id"]], row, "updated", changed))
+        await vacancy_version_service.bulk_create(self.db, versions)
+        return len(rows) - len(existing), len(existing)
+    
+    async def _flush_batch(self, batch: Dict[str, Dict[str, Any]], companies: Dict[str, Dict[str, Any]], employers: Dict[str, str], stats: Dict[str, int]):
+        if not batch:
+            return
+        try:
+            new, updated = await self._persist_batch(list(batch.values()), companies, employers)
+            await self.db.commit()
+            # Общая статистика сбрасывается только после коммита: иначе кеш успеет заполниться старыми данными
+            await analytics_service.invalidate_overall_stats()
+            stats["new"] += new
+            stats["updated"] += updated
+        except Exception as e:
+            logger.warning(f"Пачка из {len(batch)} вакансий не сохранилась ({e}), сохраняю по одной")
+            await self.db.rollback()
+            await self._flush_rows(batch, companies, employers, stats)
+        batch.clear()
+        companies.clear()
+        employers.clear()
+    
+    async def _flush_rows(self, batch: Dict[str, Dict[str, Any]], companies: Dict[str, Dict[str, Any]], employers: Dict[str, str], stats: Dict[str, int]):
+        """Запасной путь для упавшей пачки: каждая вакансия в своем SAVEPOINT, один коммит на всю пачку"""
+        new = updated = 0
+        for hh_id, row in batch.items():
+            employer = employers[hh_id]
+            try:
+                async with self.db.begin_nested():
+                    row_new, row_updated = await self._persist_batch([row], {employer: companies[employer]}, employers)
+                new += row_new
+                updated += row_updated
+            except Exception as e:
+                logger.error(f"Ошибка сохранения вакансии {hh_id}: {e}")
+                stats["errors"] += 1
+        try:
+            await self.db.commit()
+        except Exception as e:
+            logger.error(f"Ошибка сохранения пачки из {len(batch)} вакансий: {e}")
+            await self.db.rollback()
+            stats["errors"] += new + updated
+            return
+        await analytics_service.invalidate_overall_stats()
+        stats["new"] += new
+        stats["updated"] += updated
     
     async def parse_and_save(self, keywords: List[str], regions: Optional[List[int]] = None, **params) -> Dict[str, int]:
         stats = {"found": 0, "new": 0, "updated": 0, "errors": 0}
+        tasks: List[asyncio.Task] = []
         try:
             vacancies = await self.search_vacancies(keywords=keywords, regions=regions, **params)
             stats["found"] = len(vacancies)
+            # Одна метка проверки на весь прогон: без вызова часов на каждую вакансию и расхождения между строками
+            now = datetime.now()
             
-            for vac_brief in vacancies:
+            # Детали запрашиваются параллельно (не больше MAX_CONCURRENCY одновременно) и разбираются по мере
+            # готовности: пока пачка пишется в БД, запросы к HH продолжаются в фоне.
+            # Строки копятся по hh_id: ON CONFLICT не может дважды изменить одну строку в одном INSERT.
+            # Запросы склеиваются с одновременными запросами тех же id из других парсеров процесса
+            tasks = [asyncio.create_task(self.get_vacancy_details(v["id"])) for v in vacancies]
+            batch: Dict[str, Dict[str, Any]] = {}
+            companies: Dict[str, Dict[str, Any]] = {}
+            employers: Dict[str, str] = {}
+            for next_details in asyncio.as_completed(tasks):
+                vac_details = await next_details
                 try:
-                    vac_details = await self.get_vacancy_details(vac_brief["id"])
                     if not vac_details:
                         stats["errors"] += 1
                         continue
                     
-                    company = self._parse_company(vac_details.get("employer"))
-                    if not company:
+                    company_row = self._company_row(vac_details.get("employer"))
+                    if not company_row:
                         stats["errors"] += 1
                         continue
                     
-                    _, is_new = self._parse_vacancy(vac_details, company)
-                    if is_new:
-                        stats["new"] += 1
-                    else:
-                        stats["updated"] += 1
-                    
-                    self.db.commit()
+                    row = self._vacancy_row(vac_details, now=now)
+                    companies[company_row["hh_id"]] = company_row
+                    employers[row["hh_id"]] = company_row["hh_id"]
+                    batch[row["hh_id"]] = row
                 except Exception as e:
-                    logger.error(f"Ошибка обработки вакансии {vac_brief['id']}: {e}")
-                    self.db.rollback()
+                    logger.error(f"Ошибка обработки вакансии {vac_details.get('id')}: {e}")
                     stats["errors"] += 1
+                
+                if len(batch) >= self.BATCH_SIZE:
+                    await self._flush_batch(batch, companies, employers, stats)
+            
+            await self._flush_batch(batch, companies, employers, stats)
         except Exception as e:
             logger.error(f"Ошибка парсинга: {e}")
-            self.db.rollback()
+            await self.db.rollback()
+        finally:
+            # После ошибки незавершенные запросы деталей больше не нужны; HTTP-запрос отменяется,
+            # если его не ждет никто, кроме этого прогона. Ожидание доводит отмену до HTTP-запросов
+            # до выхода: иначе освободившийся семафор успеет пропустить еще один запрос
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
         
         return stats
 
+class _InflightRequest:
+    """Запрос деталей вакансии, который ждут несколько вызовов get_vacancy_details"""
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+# Общие для всех экземпляров HHParser: (цикл событий, id вакансии) -> запрос в полете.
+# Задачи привязаны к своему циклу, поэтому ключ включает цикл
+_inflight: Dict[Tuple[asyncio.AbstractEventLoop, str], _InflightRequest] = {}
+
+
+def _forget_inflight(key: Tuple[asyncio.AbstractEventLoop, str], request: _InflightRequest):
+    # Удаляет только свою запись: после отмены под тем же ключом уже может быть новый запрос
+    if _inflight.get(key) is request:
+        del _inflight[key]
+
+
+_shared_parser: Optional[HHParser] = None
+
+
+def get_hh_parser() -> HHParser:
+    """Общий парсер без БД: переиспользует пул соединений aiohttp между запросами"""
+    global _shared_parser
+    if _shared_parser is None:
+        _shared_parser = HHParser()
+    return _shared_parser
+
+
+async def close_hh_parser():
+    if _shared_parser is not None:
+        await _shared_parser.close()
+
 # ============================================
 # КОНЕЦ ФАЙЛА hh_parser.py
 # ============================================
@@ -0,0 +1,68 @@
+"""
+Celery задачи фонового парсинга HH.ru
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+import uvloop
+from celery import Celery
+from config import settings
+from app.database import engine, get_db_context
+from app.services.db_service import analytics_service
+from app.services.hh_parser import HHParser
+
+logger = logging.getLogger(__name__)
+
+celery = Celery("hh", broker=settings.REDIS_URL, backend=settings.REDIS_URL)
+
+# Периодические задачи запускает Celery Beat (один процесс), а не воркеры uvicorn
+celery.conf.beat_schedule = {
+    # Вакансии меняет не только парсинг (API, статусы), поэтому vacancy_region_counts обновляется и по расписанию
+    "refresh-region-counts": {
+        "task": "hh.refresh_region_counts",
+        "schedule": settings.REGION_COUNTS_REFRESH_INTERVAL,
+    },
+}
+if settings.PARSER_ENABLED and settings.DEFAULT_KEYWORDS:
+    celery.conf.beat_schedule["parse-default-keywords"] = {
+        "task": "hh.parse_and_save",
+        "schedule": settings.PARSER_SCHEDULE_INTERVAL,
+        "args": (settings.DEFAULT_KEYWORDS, settings.DEFAULT_REGIONS or None, {}),
+    }
+
+
+async def _parse_and_save(keywords: List[str], regions: Optional[List[int]], params: Dict[str, Any]) -> Dict[str, int]:
+    try:
+        async with get_db_context() as db:
+            async with HHParser(db) as parser:
+                stats = await parser.parse_and_save(keywords=keywords, regions=regions, **params)
+            try:
+                await analytics_service.refresh_region_counts(db)
+            except Exception as e:
+                logger.error(f"Error refreshing vacancy_region_counts: {e}")
+                await db.rollback()
+            return stats
+    finally:
+        # Соединения пула привязаны к event loop, который закрывается после задачи
+        await engine.dispose()
+
+
+async def _refresh_region_counts() -> None:
+    try:
+        async with get_db_context() as db:
+            await analytics_service.refresh_region_counts(db)
+    finally:
+        await engine.dispose()
+
+
+@celery.task(name="hh.parse_and_save")
+def parse_and_save_task(keywords: List[str], regions: Optional[List[int]] = None, params: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    # uvloop только для цикла задачи: модуль импортирует и веб-процесс, глобальную политику не трогаем
+    with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+        return runner.run(_parse_and_save(keywords, regions, params or {}))
+
+
+@celery.task(name="hh.refresh_region_counts")
+def refresh_region_counts_task() -> None:
+    with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+        runner.run(_refresh_region_counts())
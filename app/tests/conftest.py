@@ -1,73 +1,99 @@
+import asyncio
 import pytest
+import pytest_asyncio
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from app.database import Base, get_db
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+from app.database import Base, enable_sqlite_foreign_keys, get_db, get_session_factory
 from main import app
 
-# Тестовая база данных в памяти
-TEST_DATABASE_URL = "sqlite:///./test.db"
+# Тестовая база данных в памяти: одно соединение (StaticPool) держит схему на всю сессию
+TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
-engine = create_engine(
+engine = create_async_engine(
     TEST_DATABASE_URL,
-    connect_args={"check_same_thread": False}
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
 )
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+enable_sqlite_foreign_keys(engine)
+TestingSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 
 
-@pytest.fixture(scope="function")
-def test_db():
-    """Создает чистую БД для каждого теста"""
-    Base.metadata.create_all(bind=engine)
+async def _create_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def _clear_tables():
+    async with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            await conn.execute(table.delete())
+
+
+@pytest.fixture(scope="session")
+def _schema():
+    """Создает схему один раз на сессию тестов"""
+    asyncio.run(_create_tables())
     yield
-    Base.metadata.drop_all(bind=engine)
+    asyncio.run(engine.dispose())
 
 
 @pytest.fixture(scope="function")
-def db_session(test_db):
+def test_db(_schema):
+    """Очищает таблицы после теста: клиент API коммитит данные"""
+    yield
+    asyncio.run(_clear_tables())
+
+
+@pytest_asyncio.fixture(scope="function")
+async def db_session(test_db):
     """Предоставляет сессию БД для теста"""
-    connection = engine.connect()
-    transaction = connection.begin()
-    session = TestingSessionLocal(bind=connection)
-    
-    yield session
-    
-    session.close()
-    transaction.rollback()
-    connection.close()
+    async with engine.connect() as connection:
+        transaction = await connection.begin()
+        session = TestingSessionLocal(bind=connection)
+
+        yield session
+
+        await session.close()
+        await transaction.rollback()
 
 
 @pytest.fixture(scope="function")
-def client(db_session):
+def client(test_db):
     """Тестовый клиент FastAPI с переопределенной БД"""
-    def override_get_db():
-        try:
-            yield db_session
-        finally:
-            pass
+    async def override_get_db():
+        # Как get_db: сервисы только делают flush, коммит на стороне зависимости
+        async with TestingSessionLocal() as session:
+            yield session
+            await session.commit()
     
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_session_factory] = lambda: TestingSessionLocal
+    # Кеш ответов отключен, чтобы тесты не видели данные друг друга
+    FastAPICache.init(InMemoryBackend(), enable=False)
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
+    FastAPICache.reset()
 
 
 @pytest.fixture
 def sample_vacancy_data():
-    """Тестовые данные вакансии"""
+    """Тестовые данные вакансии (без company_id: его задает тест)"""
     return {
         "hh_id": "12345678",
-        "name": "FPGA Developer",
-        "employer_name": "TechCorp",
+        "title": "FPGA Developer",
+        "description": "Опыт с Verilog, SystemVerilog. Разработка FPGA",
+        "key_skills": ["Verilog", "SystemVerilog"],
+        "experience": "От 3 до 6 лет",
         "salary_from": 150000,
         "salary_to": 250000,
         "salary_currency": "RUR",
-        "area_name": "Москва",
+        "region": "Москва",
         "published_at": "2024-01-15T10:00:00",
-        "url": "https://hh.ru/vacancy/12345678",
-        "requirement": "Опыт с Verilog, SystemVerilog",
-        "responsibility": "Разработка FPGA",
-        "experience": "between3And6"
+        "url": "https://hh.ru/vacancy/12345678"
     }
 
 
@@ -77,6 +103,5 @@ def sample_company_data():
     return {
         "hh_id": "87654321",
         "name": "TechCorp",
-        "url": "https://hh.ru/employer/87654321",
-        "vacancies_count": 15
+        "url": "https://hh.ru/employer/87654321"
     }
@@ -2,21 +2,191 @@ import pytest
 from fastapi import status
 
 
+API = "/api/v1"
+
+
+@pytest.fixture
+def company_id(client, sample_company_data):
+    """Компания, к которой привязываются тестовые вакансии"""
+    response = client.post(f"{API}/companies/", json=sample_company_data)
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()["id"]
+
+
+def _create_vacancy(client, company_id, hh_id, published_at=None):
+    payload = {"hh_id": hh_id, "title": f"FPGA Developer {hh_id}", "company_id": company_id}
+    if published_at:
+        payload["published_at"] = published_at
+    response = client.post(f"{API}/vacancies/", json=payload)
+    assert response.status_code == status.HTTP_201_CREATED, response.text
+    return response.json()
+
+
 class TestVacanciesAPI:
     def test_get_vacancies_empty(self, client):
-        response = client.get("/api/vacancies/")
+        response = client.get(f"{API}/vacancies/")
         assert response.status_code == status.HTTP_200_OK
+        assert response.json()["items"] == []
 
-    def test_create_vacancy(self, client, sample_vacancy_data):
-        response = client.post("/api/vacancies/", json=sample_vacancy_data)
+    def test_create_vacancy(self, client, company_id, sample_vacancy_data):
+        response = client.post(f"{API}/vacancies/", json={**sample_vacancy_data, "company_id": company_id})
         assert response.status_code == status.HTTP_201_CREATED
+        assert response.json()["title"] == sample_vacancy_data["title"]
+
+    def test_duplicate_hh_id(self, client, company_id):
+        """Повторный hh_id отклоняется уникальным индексом с ответом 400"""
+        _create_vacancy(client, company_id, "1")
+        response = client.post(f"{API}/vacancies/", json={"hh_id": "1", "title": "Другая", "company_id": company_id})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "already exists" in response.json()["detail"]
+
+    def test_create_vacancy_unknown_company(self, client, sample_vacancy_data):
+        response = client.post(f"{API}/vacancies/", json={**sample_vacancy_data, "company_id": 1})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_list_payload(self, client, company_id):
+        """Список отдает limit вместо page_size и не сериализует пустые поля и тяжелые тексты"""
+        _create_vacancy(client, company_id, "1")
+        body = client.get(f"{API}/vacancies/", params={"limit": 10}).json()
+        assert (body["total"], body["page"], body["limit"], body["pages"]) == (1, 1, 10, 1)
+        assert "page_size" not in body
+        item = body["items"][0]
+        assert item["hh_id"] == "1"
+        assert not {"salary_from", "region", "description", "address"} & item.keys()
+
+    def test_get_vacancy_by_hh_id(self, client, company_id, sample_vacancy_data):
+        # Выборка по hh_id идет через BatchLoader на тестовой фабрике сессий
+        vacancy = client.post(f"{API}/vacancies/", json={**sample_vacancy_data, "company_id": company_id}).json()
+        response = client.get(f"{API}/vacancies/hh/{sample_vacancy_data['hh_id']}")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["id"] == vacancy["id"]
+        assert client.get(f"{API}/vacancies/hh/1").status_code == status.HTTP_404_NOT_FOUND
+
+    def test_etag_not_modified(self, client, company_id):
+        """Повторный GET с If-None-Match получает 304 без тела"""
+        vacancy = _create_vacancy(client, company_id, "1")
+        response = client.get(f"{API}/vacancies/{vacancy['id']}")
+        etag = response.headers["ETag"]
+
+        response = client.get(f"{API}/vacancies/{vacancy['id']}", headers={"If-None-Match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.content == b""
+
+        response = client.get(f"{API}/vacancies/{vacancy['id']}", headers={"If-None-Match": '"stale"'})
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_head_exists(self, client, company_id):
+        """HEAD отвечает 200 для существующей вакансии и 404 для отсутствующей"""
+        vacancy = _create_vacancy(client, company_id, "1")
+        assert client.head(f"{API}/vacancies/{vacancy['id']}").status_code == status.HTTP_200_OK
+        assert client.head(f"{API}/vacancies/{vacancy['id'] + 1}").status_code == status.HTTP_404_NOT_FOUND
+
+    def test_summary(self, client, company_id, sample_vacancy_data):
+        for hh_id, vacancy_status in [("1", "active"), ("2", "archived")]:
+            client.post(f"{API}/vacancies/", json={**sample_vacancy_data, "hh_id": hh_id, "status": vacancy_status, "company_id": company_id})
+        response = client.get(f"{API}/vacancies/stats/summary")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"total_vacancies": 2, "active_vacancies": 1, "archived_vacancies": 1}
+
+    def test_overall_stats(self, client, company_id, sample_vacancy_data):
+        client.post(f"{API}/vacancies/", json={**sample_vacancy_data, "company_id": company_id})
+        response = client.get(f"{API}/vacancies/stats/overall")
+        assert response.status_code == status.HTTP_200_OK
+        stats = response.json()
+        assert (stats["total_vacancies"], stats["active_vacancies"], stats["total_companies"]) == (1, 1, 1)
+        assert stats["top_regions"] == [{"region": "Москва", "count": 1}]
+        assert stats["salary_stats"]["min_from"] == sample_vacancy_data["salary_from"]
+
+
+class TestVacancyListPagination:
+    """Keyset-пагинация списка вакансий"""
+
+    @pytest.fixture
+    def vacancies(self, client, company_id):
+        """Пять вакансий: две с одинаковой датой и одна без даты публикации"""
+        dates = ["2024-01-10T10:00:00", "2024-01-12T10:00:00", "2024-01-12T10:00:00", None, "2024-01-11T10:00:00"]
+        return [_create_vacancy(client, company_id, str(i), published_at) for i, published_at in enumerate(dates)]
+
+    def test_cursor_walk_matches_offset_order(self, client, vacancies):
+        """Проход по next_cursor отдает те же вакансии и в том же порядке, что и один offset-запрос"""
+        expected = [v["id"] for v in client.get(f"{API}/vacancies/", params={"limit": 100}).json()["items"]]
+        assert len(expected) == len(vacancies)
+
+        first = client.get(f"{API}/vacancies/", params={"limit": 2}).json()
+        assert first["total"] == len(vacancies)
+        seen = [v["id"] for v in first["items"]]
+        cursor = first["next_cursor"]
+        while cursor:
+            response = client.get(f"{API}/vacancies/", params={"limit": 2, "cursor": cursor})
+            assert response.status_code == status.HTTP_200_OK
+            body = response.json()
+            assert "total" not in body
+            seen += [v["id"] for v in body["items"]]
+            cursor = body.get("next_cursor")
+
+        assert seen == expected
+
+    def test_cursor_past_the_end(self, client, vacancies):
+        """Курсор за последней вакансией: пустая страница без next_cursor"""
+        last = client.get(f"{API}/vacancies/", params={"limit": 100}).json()["items"][-1]
+        response = client.get(f"{API}/vacancies/", params={"cursor": f",{last['id']}"})
+        assert response.status_code == status.HTTP_200_OK
+        body = response.json()
+        assert body["items"] == []
+        assert "next_cursor" not in body
+
+    def test_invalid_cursor(self, client):
+        """Нечитаемый курсор - 400, а не 500"""
+        response = client.get(f"{API}/vacancies/", params={"cursor": "yesterday,abc"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_cursor_with_offset(self, client, company_id, sample_vacancy_data):
+        """Дата курсора со смещением сравнивается с published_at в UTC"""
+        ids = []
+        for hh_id, published_at in [("1", "2024-01-12T10:00:00"), ("2", "2024-01-11T10:00:00")]:
+            payload = {**sample_vacancy_data, "hh_id": hh_id, "published_at": published_at, "company_id": company_id}
+            ids.append(client.post(f"{API}/vacancies/", json=payload).json()["id"])
+
+        response = client.get(f"{API}/vacancies/", params={"cursor": f"2024-01-12T13:00:00+03:00,{ids[0]}"})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [v["id"] for v in response.json()["items"]] == [ids[1]]
 
 
 class TestCompaniesAPI:
     def test_get_companies_empty(self, client):
-        response = client.get("/api/companies/")
+        response = client.get(f"{API}/companies/")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == []
+
+    def test_get_company_by_hh_id(self, client, company_id, sample_company_data):
+        response = client.get(f"{API}/companies/hh/{sample_company_data['hh_id']}")
         assert response.status_code == status.HTTP_200_OK
+        assert response.json()["id"] == company_id
+        assert client.get(f"{API}/companies/hh/1").status_code == status.HTTP_404_NOT_FOUND
+
+    def test_company_etag_not_modified(self, client, company_id):
+        response = client.get(f"{API}/companies/{company_id}")
+        assert response.status_code == status.HTTP_200_OK
+        etag = response.headers["ETag"]
+        for if_none_match in [etag, f'"stale", W/{etag}', "*"]:
+            response = client.get(f"{API}/companies/{company_id}", headers={"If-None-Match": if_none_match})
+            assert response.status_code == status.HTTP_304_NOT_MODIFIED
+            assert response.headers["ETag"] == etag
+        response = client.get(f"{API}/companies/{company_id}", headers={"If-None-Match": '"stale"'})
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_company_head_exists(self, client, company_id):
+        assert client.head(f"{API}/companies/{company_id}").status_code == status.HTTP_200_OK
+        assert client.head(f"{API}/companies/{company_id + 1}").status_code == status.HTTP_404_NOT_FOUND
+
+    def test_delete_company_cascades(self, client, company_id):
+        """Core DELETE компании удаляет ее вакансии через ON DELETE CASCADE"""
+        vacancy = _create_vacancy(client, company_id, "1")
+        assert client.delete(f"{API}/companies/{company_id}").status_code == status.HTTP_204_NO_CONTENT
+        assert client.head(f"{API}/vacancies/{vacancy['id']}").status_code == status.HTTP_404_NOT_FOUND
 
     def test_create_company(self, client, sample_company_data):
-        response = client.post("/api/companies/", json=sample_company_data)
+        response = client.post(f"{API}/companies/", json=sample_company_data)
         assert response.status_code == status.HTTP_201_CREATED
+        assert response.json()["hh_id"] == sample_company_data["hh_id"]
@@ -0,0 +1,69 @@
+import asyncio
+from contextlib import nullcontext
+import pytest
+from app.services.batch_loader import BatchLoader
+
+
+class TestBatchLoader:
+    """Юнит-тесты для BatchLoader"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_loads_share_one_query(self):
+        """Конкурентные load() склеиваются в один вызов batch_fn с уникальными ключами"""
+        calls = []
+
+        async def batch_fn(db, keys):
+            calls.append(sorted(keys))
+            return {key: f"row-{key}" for key in keys if key != "missing"}
+
+        loader = BatchLoader(batch_fn, lambda: nullcontext())
+        results = await asyncio.gather(*(loader.load(key) for key in ["1", "2", "1", "missing"]))
+
+        assert results == ["row-1", "row-2", "row-1", None]
+        assert calls == [["1", "2", "missing"]]
+
+    @pytest.mark.asyncio
+    async def test_error_reaches_every_waiter(self):
+        """Ошибка запроса пачки передается всем ожидающим"""
+        async def batch_fn(db, keys):
+            raise RuntimeError("db down")
+
+        loader = BatchLoader(batch_fn, lambda: nullcontext())
+        results = await asyncio.gather(loader.load("1"), loader.load("2"), return_exceptions=True)
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+    @pytest.mark.asyncio
+    async def test_cancelled_query_cancels_waiters(self):
+        """Отмена _drain во время запроса пачки отменяет ожидающих, а не оставляет их висеть"""
+        started = asyncio.Event()
+
+        async def batch_fn(db, keys):
+            started.set()
+            await asyncio.Event().wait()
+
+        loader = BatchLoader(batch_fn, lambda: nullcontext())
+        waiters = [asyncio.create_task(loader.load(key)) for key in ["1", "2"]]
+        await asyncio.sleep(0)
+        drain = loader._task
+        await started.wait()
+        drain.cancel()
+
+        results = await asyncio.wait_for(asyncio.gather(*waiters, return_exceptions=True), 1)
+        assert all(isinstance(result, asyncio.CancelledError) for result in results)
+
+    @pytest.mark.asyncio
+    async def test_cancelled_before_query_frees_loader(self):
+        """Отмена _drain до сбора пачки отменяет ожидающих, следующий load() запускает новый _drain"""
+        async def batch_fn(db, keys):
+            return {key: f"row-{key}" for key in keys}
+
+        loader = BatchLoader(batch_fn, lambda: nullcontext(), delay=60)
+        waiter = asyncio.create_task(loader.load("1"))
+        await asyncio.sleep(0)
+        loader._task.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(waiter, 1)
+        loader.delay = 0
+        assert await asyncio.wait_for(loader.load("2"), 1) == "row-2"
@@ -1,150 +1,189 @@
 import pytest
-from datetime import datetime
-from app.services.db_service import DBService
-from app.models import Vacancy, Company
+import pytest_asyncio
+from app.schemas import CompanyCreate, VacancyCreate, VacancyUpdate
+from app.services import db_service
+from app.services.db_service import OVERALL_STATS_KEY, OVERALL_STATS_TTL, analytics_service, company_service, vacancy_service
 
 
-class TestDBService:
-    """Юнит-тесты для DBService"""
+class TestCompanyService:
+    """Юнит-тесты для CompanyService"""
 
-    @pytest.fixture
-    def db_service(self, db_session):
-        """Создает экземпляр DB service для тестов"""
-        return DBService(db_session)
-
-    def test_save_vacancy(self, db_service, db_session, sample_vacancy_data):
-        """Тест сохранения вакансии"""
-        db_service.save_vacancy(sample_vacancy_data)
-        
-        # Проверяем, что вакансия сохранена
-        vacancy = db_session.query(Vacancy).filter_by(
-            hh_id=sample_vacancy_data["hh_id"]
-        ).first()
-        
-        assert vacancy is not None
-        assert vacancy.name == sample_vacancy_data["name"]
-        assert vacancy.employer_name == sample_vacancy_data["employer_name"]
-        assert vacancy.salary_from == sample_vacancy_data["salary_from"]
-
-    def test_save_vacancy_duplicate(self, db_service, db_session, sample_vacancy_data):
-        """Тест обработки дубликата"""
-        # Сохраняем вакансию дважды
-        db_service.save_vacancy(sample_vacancy_data)
-        db_service.save_vacancy(sample_vacancy_data)
-        
-        # Проверяем, что сохранена только одна запись
-        count = db_session.query(Vacancy).filter_by(
-            hh_id=sample_vacancy_data["hh_id"]
-        ).count()
-        
-        assert count == 1
-
-    def test_get_vacancy_by_hh_id(self, db_service, db_session, sample_vacancy_data):
-        """Тест получения вакансии по ID"""
-        db_service.save_vacancy(sample_vacancy_data)
-        
-        vacancy = db_service.get_vacancy_by_hh_id(sample_vacancy_data["hh_id"])
-        
-        assert vacancy is not None
-        assert vacancy.name == sample_vacancy_data["name"]
-
-    def test_get_vacancy_not_found(self, db_service):
-        """Тест получения несуществующей вакансии"""
-        vacancy = db_service.get_vacancy_by_hh_id("nonexistent")
-        assert vacancy is None
-
-    def test_get_all_vacancies(self, db_service, sample_vacancy_data):
-        """Тест получения всех вакансий"""
-        # Сохраняем несколько вакансий
-        vacancy1 = sample_vacancy_data.copy()
-        vacancy2 = sample_vacancy_data.copy()
-        vacancy2["hh_id"] = "87654321"
-        vacancy2["name"] = "ASIC Engineer"
-        
-        db_service.save_vacancy(vacancy1)
-        db_service.save_vacancy(vacancy2)
-        
-        vacancies = db_service.get_all_vacancies()
-        
-        assert len(vacancies) == 2
-
-    def test_get_vacancies_with_filters(self, db_service, sample_vacancy_data):
-        """Тест фильтрации вакансий"""
-        vacancy1 = sample_vacancy_data.copy()
-        vacancy2 = sample_vacancy_data.copy()
-        vacancy2["hh_id"] = "87654321"
-        vacancy2["name"] = "Python Developer"
-        
-        db_service.save_vacancy(vacancy1)
-        db_service.save_vacancy(vacancy2)
-        
-        # Фильтр по имени
-        vacancies = db_service.get_vacancies_with_filters(name="FPGA")
-        
-        assert len(vacancies) == 1
-        assert vacancies[0].name == "FPGA Developer"
-
-    def test_save_company(self, db_service, db_session, sample_company_data):
+    @pytest.mark.asyncio
+    async def test_create_company(self, db_session, sample_company_data):
         """Тест сохранения компании"""
-        db_service.save_company(sample_company_data)
-        
-        company = db_session.query(Company).filter_by(
-            hh_id=sample_company_data["hh_id"]
-        ).first()
-        
-        assert company is not None
-        assert company.name == sample_company_data["name"]
-        assert company.vacancies_count == sample_company_data["vacancies_count"]
-
-    def test_get_company_by_hh_id(self, db_service, sample_company_data):
-        """Тест получения компании по ID"""
-        db_service.save_company(sample_company_data)
-        
-        company = db_service.get_company_by_hh_id(sample_company_data["hh_id"])
-        
+        company = await company_service.create(db_session, CompanyCreate(**sample_company_data))
+
+        assert company.id is not None
+        assert (await company_service.get(db_session, company.id)).name == sample_company_data["name"]
+
+    @pytest.mark.asyncio
+    async def test_get_company_by_hh_id(self, db_session, sample_company_data):
+        """Тест получения компании по ID HH"""
+        await company_service.create(db_session, CompanyCreate(**sample_company_data))
+
+        company = await company_service.get_by_hh_id(db_session, sample_company_data["hh_id"])
+
         assert company is not None
         assert company.name == sample_company_data["name"]
+        assert await company_service.get_by_hh_id(db_session, "nonexistent") is None
 
-    def test_get_all_companies(self, db_service, sample_company_data):
+    @pytest.mark.asyncio
+    async def test_get_all_companies(self, db_session, sample_company_data):
         """Тест получения всех компаний"""
-        company1 = sample_company_data.copy()
-        company2 = sample_company_data.copy()
-        company2["hh_id"] = "11111111"
-        company2["name"] = "SiliconCorp"
-        
-        db_service.save_company(company1)
-        db_service.save_company(company2)
-        
-        companies = db_service.get_all_companies()
-        
+        await company_service.create(db_session, CompanyCreate(**sample_company_data))
+        await company_service.create(db_session, CompanyCreate(**{**sample_company_data, "hh_id": "11111111", "name": "SiliconCorp"}))
+
+        companies = await company_service.get_all(db_session)
+
         assert len(companies) == 2
 
-    def test_delete_vacancy(self, db_service, db_session, sample_vacancy_data):
-        """Тест удаления вакансии"""
-        db_service.save_vacancy(sample_vacancy_data)
-        
-        db_service.delete_vacancy(sample_vacancy_data["hh_id"])
-        
-        vacancy = db_session.query(Vacancy).filter_by(
-            hh_id=sample_vacancy_data["hh_id"]
-        ).first()
-        
-        assert vacancy is None
-
-    def test_update_vacancy(self, db_service, db_session, sample_vacancy_data):
+
+class TestVacancyService:
+    """Юнит-тесты для VacancyService"""
+
+    @pytest_asyncio.fixture
+    async def company_id(self, db_session, sample_company_data):
+        """Компания, к которой привязываются тестовые вакансии"""
+        return (await company_service.create(db_session, CompanyCreate(**sample_company_data))).id
+
+    @pytest.fixture
+    def make_vacancy(self, db_session, company_id, sample_vacancy_data):
+        """Создает вакансию на основе тестовых данных с переопределенными полями"""
+        async def make(**fields):
+            return await vacancy_service.create(db_session, VacancyCreate(**{**sample_vacancy_data, "company_id": company_id, **fields}))
+        return make
+
+    @pytest.mark.asyncio
+    async def test_create_vacancy(self, make_vacancy, sample_vacancy_data):
+        """Тест сохранения вакансии: ответ сразу содержит компанию"""
+        vacancy = await make_vacancy()
+
+        assert vacancy.title == sample_vacancy_data["title"]
+        assert vacancy.salary_from == sample_vacancy_data["salary_from"]
+        assert vacancy.company.hh_id == "87654321"
+
+    @pytest.mark.asyncio
+    async def test_get_vacancy_by_hh_id(self, db_session, make_vacancy, sample_vacancy_data):
+        """Тест получения вакансии по ID HH"""
+        await make_vacancy()
+
+        vacancy = await vacancy_service.get_by_hh_id(db_session, sample_vacancy_data["hh_id"])
+
+        assert vacancy is not None
+        assert vacancy.title == sample_vacancy_data["title"]
+        assert await vacancy_service.get_by_hh_id(db_session, "nonexistent") is None
+
+    @pytest.mark.asyncio
+    async def test_get_all_vacancies(self, db_session, make_vacancy):
+        """Тест получения всех вакансий с фильтром по региону"""
+        await make_vacancy()
+        await make_vacancy(hh_id="87654321", title="ASIC Engineer", region="Санкт-Петербург")
+
+        assert len(await vacancy_service.get_all(db_session)) == 2
+        assert [v.title for v in await vacancy_service.get_all(db_session, region="Москва")] == ["FPGA Developer"]
+
+    @pytest.mark.asyncio
+    async def test_search_by_keywords(self, db_session, make_vacancy):
+        """Тест поиска по ключевым словам и зарплате"""
+        await make_vacancy()
+        await make_vacancy(hh_id="87654321", title="Python Developer", description="Django, FastAPI", salary_from=100000)
+
+        vacancies = await vacancy_service.search(db_session, keywords=["FPGA"])
+        assert [v.title for v in vacancies] == ["FPGA Developer"]
+
+        vacancies = await vacancy_service.search(db_session, min_salary=120000)
+        assert [v.title for v in vacancies] == ["FPGA Developer"]
+
+    @pytest.mark.asyncio
+    async def test_summary_counts(self, db_session, make_vacancy):
+        """Тест сводки: всего и активных вакансий одним агрегатом"""
+        assert await vacancy_service.summary_counts(db_session) == (0, 0)
+
+        await make_vacancy()
+        await make_vacancy(hh_id="2", status="archived")
+        await make_vacancy(hh_id="3", status="closed")
+
+        assert await vacancy_service.summary_counts(db_session) == (3, 1)
+
+    @pytest.mark.asyncio
+    async def test_update_vacancy(self, db_session, make_vacancy):
         """Тест обновления вакансии"""
-        db_service.save_vacancy(sample_vacancy_data)
-        
-        # Обновляем данные
-        updated_data = sample_vacancy_data.copy()
-        updated_data["salary_from"] = 200000
-        updated_data["salary_to"] = 300000
-        
-        db_service.update_vacancy(updated_data["hh_id"], updated_data)
-        
-        vacancy = db_session.query(Vacancy).filter_by(
-            hh_id=sample_vacancy_data["hh_id"]
-        ).first()
-        
+        vacancy = await make_vacancy()
+
+        await vacancy_service.update(db_session, vacancy.id, VacancyUpdate(salary_from=200000, salary_to=300000))
+
+        vacancy = await vacancy_service.get(db_session, vacancy.id)
         assert vacancy.salary_from == 200000
         assert vacancy.salary_to == 300000
+
+    @pytest.mark.asyncio
+    async def test_delete_vacancy(self, db_session, make_vacancy):
+        """Тест удаления вакансии"""
+        vacancy = await make_vacancy()
+
+        assert await vacancy_service.delete(db_session, vacancy.id)
+        assert not await vacancy_service.exists(db_session, vacancy.id)
+        assert not await vacancy_service.delete(db_session, vacancy.id)
+
+
+class MemoryRedis:
+    """Redis в памяти: только команды, которые использует кеш статистики"""
+
+    def __init__(self):
+        self.data = {}
+        self.ttl = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def setex(self, key, ttl, value):
+        self.data[key] = value
+        self.ttl[key] = ttl
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+
+class TestAnalyticsService:
+    """Юнит-тесты для кеша общей статистики"""
+
+    @pytest.fixture
+    def redis(self, monkeypatch):
+        redis = MemoryRedis()
+        monkeypatch.setattr(db_service, "get_redis", lambda: redis)
+        return redis
+
+    @pytest_asyncio.fixture
+    async def add_vacancy(self, db_session, sample_company_data, sample_vacancy_data):
+        """Добавляет вакансию с заданным hh_id к одной тестовой компании"""
+        company = await company_service.create(db_session, CompanyCreate(**sample_company_data))
+
+        async def add(hh_id):
+            await vacancy_service.create(db_session, VacancyCreate(**{**sample_vacancy_data, "hh_id": hh_id, "company_id": company.id}))
+        return add
+
+    @pytest.mark.asyncio
+    async def test_stats_are_cached(self, db_session, redis, add_vacancy):
+        """Тест кеша: повторный вызов в пределах TTL не пересчитывает статистику, сброс ключа - пересчитывает"""
+        await add_vacancy("1")
+        stats = await analytics_service.calculate_overall_stats(db_session)
+        assert stats["total_vacancies"] == 1
+        assert redis.ttl[OVERALL_STATS_KEY] == OVERALL_STATS_TTL
+
+        await add_vacancy("2")
+        assert (await analytics_service.calculate_overall_stats(db_session))["total_vacancies"] == 1
+
+        await analytics_service.invalidate_overall_stats()
+        assert (await analytics_service.calculate_overall_stats(db_session))["total_vacancies"] == 2
+
+    @pytest.mark.asyncio
+    async def test_stats_without_redis(self, db_session, monkeypatch, add_vacancy):
+        """Тест недоступного Redis: статистика считается из БД, а не падает"""
+        def broken_redis():
+            raise ConnectionError("redis down")
+
+        monkeypatch.setattr(db_service, "get_redis", broken_redis)
+        await add_vacancy("1")
+
+        assert (await analytics_service.calculate_overall_stats(db_session))["total_vacancies"] == 1
+        await analytics_service.invalidate_overall_stats()
@@ -1,6 +1,62 @@
+import asyncio
 import pytest
-from unittest.mock import Mock, patch
-from app.services.hh_parser import HHParser
+from contextlib import asynccontextmanager
+from datetime import datetime
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from sqlalchemy import select, update
+from app.models import Company, Vacancy, VacancyVersion
+from app.services.db_service import analytics_service
+from app.services.hh_parser import HHParser, HHParserError, HHRateLimitError, _inflight
+
+
+@asynccontextmanager
+async def hh_server(routes):
+    """Локальный HTTP-сервер вместо api.hh.ru и парсер, направленный на него"""
+    app = web.Application()
+    for path, handler in routes.items():
+        app.router.add_get(path, handler)
+    server = TestServer(app)
+    await server.start_server()
+    parser = HHParser()
+    parser.BASE_URL = f"http://{server.host}:{server.port}"
+    parser.REQUEST_DELAY = 0
+    try:
+        yield parser
+    finally:
+        await parser.close()
+        await server.close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Паузы backoff записываются, а не выдерживаются"""
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay, *args, **kwargs):
+        delays.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    return delays
+
+
+@pytest.fixture
+def hh_vacancy():
+    """Вакансия в формате ответа API HH"""
+    return {
+        "id": "12345678",
+        "name": "FPGA Developer",
+        "description": "Разработка FPGA",
+        "employer": {"id": "87654321", "name": "TechCorp", "alternate_url": "https://hh.ru/employer/87654321"},
+        "salary": {"from": 150000, "to": 250000, "currency": "RUR", "gross": True},
+        "area": {"name": "Москва"},
+        "published_at": "2024-01-15T10:00:00",
+        "alternate_url": "https://hh.ru/vacancy/12345678",
+        "key_skills": [{"name": "Verilog"}, {"name": "SystemVerilog"}],
+        "experience": {"id": "between3And6"}
+    }
 
 
 class TestHHParser:
@@ -11,150 +67,402 @@ class TestHHParser:
         """Создает экземпляр парсера для тестов"""
         return HHParser()
 
-    def test_init(self, parser):
-        """Тест инициализации парсера"""
-        assert parser.base_url == "https://api.hh.ru/vacancies"
-        assert parser.search_params is not None
-        assert "Verilog" in parser.search_params["text"]
-
-    @patch('app.services.hh_parser.requests.get')
-    def test_search_vacancies_success(self, mock_get, parser):
-        """Тест успешного поиска вакансий"""
-        # Mock response
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {
-            "items": [
-                {
-                    "id": "12345678",
-                    "name": "FPGA Developer",
-                    "employer": {"name": "TechCorp"},
-                    "salary": {"from": 150000, "to": 250000, "currency": "RUR"},
-                    "area": {"name": "Москва"},
-                    "published_at": "2024-01-15T10:00:00",
-                    "alternate_url": "https://hh.ru/vacancy/12345678",
-                    "snippet": {
-                        "requirement": "Опыт с Verilog",
-                        "responsibility": "Разработка FPGA"
-                    },
-                    "experience": {"id": "between3And6"}
-                }
-            ],
-            "found": 1,
-            "pages": 1,
-            "page": 0
-        }
-        mock_get.return_value = mock_response
+    def test_vacancy_row(self, parser, hh_vacancy):
+        """Тест разбора вакансии в строку таблицы"""
+        now = datetime(2024, 1, 16)
 
-        # Execute
-        result = parser.search_vacancies()
+        row = parser._vacancy_row(hh_vacancy, company_id=7, now=now)
 
-        # Assert
-        assert result is not None
-        assert "items" in result
-        assert len(result["items"]) == 1
-        assert result["items"][0]["name"] == "FPGA Developer"
-        mock_get.assert_called_once()
+        assert row["hh_id"] == "12345678"
+        assert row["company_id"] == 7
+        assert row["title"] == "FPGA Developer"
+        assert row["key_skills"] == ["Verilog", "SystemVerilog"]
+        assert row["experience"] == "От 3 до 6 лет"
+        assert (row["salary_from"], row["salary_to"], row["salary_currency"], row["salary_gross"]) == (150000, 250000, "RUR", True)
+        assert row["region"] == "Москва"
+        assert row["published_at"] == datetime(2024, 1, 15, 10)
+        assert row["last_checked_at"] == now
 
-    @patch('app.services.hh_parser.requests.get')
-    def test_search_vacancies_error(self, mock_get, parser):
-        """Тест обработки ошибки при поиске"""
-        mock_response = Mock()
-        mock_response.status_code = 500
-        mock_get.return_value = mock_response
-
-        result = parser.search_vacancies()
-
-        assert result is None
-
-    def test_parse_vacancy_data(self, parser):
-        """Тест парсинга данных вакансии"""
-        vacancy = {
-            "id": "12345678",
-            "name": "FPGA Developer",
-            "employer": {"name": "TechCorp"},
-            "salary": {"from": 150000, "to": 250000, "currency": "RUR"},
-            "area": {"name": "Москва"},
-            "published_at": "2024-01-15T10:00:00",
-            "alternate_url": "https://hh.ru/vacancy/12345678",
-            "snippet": {
-                "requirement": "Опыт с Verilog",
-                "responsibility": "Разработка FPGA"
-            },
-            "experience": {"id": "between3And6"}
-        }
+    def test_vacancy_row_published_at_offset(self, parser, hh_vacancy):
+        """Тест даты публикации со смещением: в строку попадает UTC без часового пояса"""
+        hh_vacancy["published_at"] = "2024-01-15T13:00:00+0300"
 
-        parsed = parser.parse_vacancy_data(vacancy)
-
-        assert parsed["hh_id"] == "12345678"
-        assert parsed["name"] == "FPGA Developer"
-        assert parsed["employer_name"] == "TechCorp"
-        assert parsed["salary_from"] == 150000
-        assert parsed["salary_to"] == 250000
-        assert parsed["area_name"] == "Москва"
-
-    def test_parse_vacancy_data_no_salary(self, parser):
-        """Тест парсинга вакансии без зарплаты"""
-        vacancy = {
-            "id": "12345678",
-            "name": "FPGA Developer",
-            "employer": {"name": "TechCorp"},
-            "salary": None,
-            "area": {"name": "Москва"},
-            "published_at": "2024-01-15T10:00:00",
-            "alternate_url": "https://hh.ru/vacancy/12345678",
-            "snippet": {
-                "requirement": "Опыт",
-                "responsibility": "Работа"
-            },
-            "experience": {"id": "noExperience"}
-        }
+        row = parser._vacancy_row(hh_vacancy)
+
+        assert row["published_at"] == datetime(2024, 1, 15, 10)
+        assert row["published_at"].tzinfo is None
 
-        parsed = parser.parse_vacancy_data(vacancy)
+    def test_vacancy_row_no_salary(self, parser, hh_vacancy):
+        """Тест разбора вакансии без зарплаты, опыта и с битой датой"""
+        hh_vacancy.update(salary=None, experience=None, published_at="вчера")
 
-        assert parsed["salary_from"] is None
-        assert parsed["salary_to"] is None
-        assert parsed["salary_currency"] is None
+        row = parser._vacancy_row(hh_vacancy)
 
-    @patch('app.services.hh_parser.requests.get')
-    def test_get_employer_info_success(self, mock_get, parser):
-        """Тест получения информации о работодателе"""
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {
-            "id": "87654321",
+        assert row["salary_from"] is None
+        assert row["salary_to"] is None
+        assert row["salary_currency"] is None
+        assert row["experience"] == "Не указано"
+        assert row["published_at"] is None
+
+    def test_company_row(self, parser, hh_vacancy):
+        """Тест разбора работодателя; анонимный работодатель без id пропускается"""
+        assert parser._company_row(hh_vacancy["employer"]) == {
+            "hh_id": "87654321",
             "name": "TechCorp",
-            "alternate_url": "https://hh.ru/employer/87654321",
-            "open_vacancies": 15
+            "url": "https://hh.ru/employer/87654321"
+        }
+        assert parser._company_row({"name": "Кадровое агентство"}) is None
+        assert parser._company_row(None) is None
+
+    @pytest.mark.asyncio
+    async def test_search_vacancies(self, hh_vacancy):
+        """Тест поиска: страницы запрашиваются с page, дубли между страницами отбрасываются"""
+        pages = {
+            "0": [hh_vacancy, {**hh_vacancy, "id": "2"}],
+            "1": [{**hh_vacancy, "id": "2"}, {**hh_vacancy, "id": "3"}]
         }
-        mock_get.return_value = mock_response
-
-        result = parser.get_employer_info("87654321")
-
-        assert result is not None
-        assert result["id"] == "87654321"
-        assert result["name"] == "TechCorp"
-        assert result["open_vacancies"] == 15
-
-    def test_filter_by_keywords(self, parser):
-        """Тест фильтрации по ключевым словам"""
-        vacancies = [
-            {
-                "name": "FPGA Developer",
-                "snippet": {"requirement": "Опыт с Verilog, SystemVerilog"}
-            },
-            {
-                "name": "Python Developer",
-                "snippet": {"requirement": "Django, FastAPI"}
-            },
-            {
-                "name": "ASIC Engineer",
-                "snippet": {"requirement": "VHDL, Cadence"}
-            }
-        ]
-
-        filtered = parser.filter_by_keywords(vacancies, ["Verilog", "VHDL"])
-
-        assert len(filtered) == 2
-        assert any("FPGA" in v["name"] for v in filtered)
-        assert any("ASIC" in v["name"] for v in filtered)
+        queries = []
+
+        async def handler(request):
+            queries.append(dict(request.query))
+            return web.json_response({"items": pages[request.query["page"]], "pages": 2})
+
+        async with hh_server({"/vacancies": handler}) as parser:
+            vacancies = await parser.search_vacancies(keywords=["FPGA"], regions=[1])
+
+        assert [v["id"] for v in vacancies] == ["12345678", "2", "3"]
+        assert sorted(q["page"] for q in queries) == ["0", "1"]
+        assert all(q["text"] == "FPGA" and q["area"] == "1" for q in queries)
+
+    @pytest.mark.asyncio
+    async def test_search_vacancies_error(self):
+        """Тест обработки ошибки при поиске"""
+        async def handler(request):
+            return web.Response(status=500)
+
+        async with hh_server({"/vacancies": handler}) as parser:
+            assert await parser.search_vacancies(keywords=["FPGA"]) == []
+
+    @pytest.mark.asyncio
+    async def test_get_employer(self):
+        """Тест получения информации о работодателе; 404 дает None"""
+        async def handler(request):
+            if request.match_info["id"] != "87654321":
+                return web.Response(status=404)
+            return web.json_response({"id": "87654321", "name": "TechCorp", "open_vacancies": 15})
+
+        async with hh_server({"/employers/{id}": handler}) as parser:
+            employer = await parser.get_employer("87654321")
+            missing = await parser.get_employer("1")
+
+        assert employer["name"] == "TechCorp"
+        assert employer["open_vacancies"] == 15
+        assert missing is None
+
+
+class TestMakeRequestRetries:
+    """Ограниченный цикл повторов _make_request"""
+
+    @pytest.mark.asyncio
+    async def test_retry_after_is_honoured(self, sleeps):
+        """429 с Retry-After повторяется через указанную паузу"""
+        hits = []
+
+        async def handler(request):
+            hits.append(request.path)
+            if len(hits) < 3:
+                return web.Response(status=429, headers={"Retry-After": "2.5"})
+            return web.json_response({"id": "1"})
+
+        async with hh_server({"/vacancies/{id}": handler}) as parser:
+            assert await parser._make_request("/vacancies/1") == {"id": "1"}
+
+        assert len(hits) == 3
+        assert [d for d in sleeps if d] == [2.5, 2.5]
+
+    @pytest.mark.asyncio
+    async def test_rate_limit_exhausts_attempts(self, sleeps):
+        """Без Retry-After пауза растет экспоненциально, после RETRY_ATTEMPTS повторов - HHRateLimitError"""
+        hits = []
+
+        async def handler(request):
+            hits.append(request.path)
+            return web.Response(status=429)
+
+        async with hh_server({"/vacancies/{id}": handler}) as parser:
+            with pytest.raises(HHRateLimitError):
+                await parser._make_request("/vacancies/1")
+
+        assert len(hits) == HHParser.RETRY_ATTEMPTS + 1
+        assert [d for d in sleeps if d] == [HHParser.RETRY_DELAY * 2 ** i for i in range(HHParser.RETRY_ATTEMPTS)]
+
+    @pytest.mark.asyncio
+    async def test_server_error_is_not_retried(self, sleeps):
+        """Ответ 5xx не повторяется"""
+        hits = []
+
+        async def handler(request):
+            hits.append(request.path)
+            return web.Response(status=500)
+
+        async with hh_server({"/vacancies/{id}": handler}) as parser:
+            with pytest.raises(HHParserError):
+                await parser._make_request("/vacancies/1")
+
+        assert len(hits) == 1
+
+
+class GatedParser(HHParser):
+    """Парсер, у которого запрос деталей ждет сигнала теста"""
+    REQUEST_DELAY = 0
+
+    def __init__(self, db=None):
+        super().__init__(db)
+        self.requests = []
+        self.gate = asyncio.Event()
+
+    async def _make_request(self, endpoint, params=None):
+        self.requests.append(endpoint)
+        await self.gate.wait()
+        return {"id": endpoint.rsplit("/", 1)[1], "employer": {"id": "e1", "name": "TechCorp"}}
+
+
+class TestInflightCoalescing:
+    """Склейка одновременных запросов деталей вакансии"""
+
+    @pytest.mark.asyncio
+    async def test_same_id_is_fetched_once(self):
+        """Одновременные запросы одного id ждут один HTTP-запрос"""
+        parser = GatedParser()
+        waiters = [asyncio.create_task(parser.get_vacancy_details(vid)) for vid in ["1", "1", "2"]]
+        await asyncio.sleep(0)
+        parser.gate.set()
+
+        results = await asyncio.gather(*waiters)
+
+        assert [r["id"] for r in results] == ["1", "1", "2"]
+        assert sorted(parser.requests) == ["/vacancies/1", "/vacancies/2"]
+        assert _inflight == {}
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_cancel_others(self):
+        """Отмена одного ожидающего не отменяет общий запрос"""
+        parser = GatedParser()
+        first = asyncio.create_task(parser.get_vacancy_details("1"))
+        second = asyncio.create_task(parser.get_vacancy_details("1"))
+        await asyncio.sleep(0)
+        first.cancel()
+        parser.gate.set()
+
+        assert (await second)["id"] == "1"
+        assert parser.requests == ["/vacancies/1"]
+
+    @pytest.mark.asyncio
+    async def test_parsers_share_inflight_requests(self):
+        """Разные экземпляры парсера (общий парсер API и parse_and_save) склеивают запросы одного id"""
+        first, second = GatedParser(), GatedParser()
+        waiters = [asyncio.create_task(parser.get_vacancy_details("1")) for parser in (first, second)]
+        await asyncio.sleep(0)
+        first.gate.set()
+
+        results = await asyncio.gather(*waiters)
+
+        assert [r["id"] for r in results] == ["1", "1"]
+        assert first.requests == ["/vacancies/1"]
+        assert second.requests == []
+
+    @pytest.mark.asyncio
+    async def test_last_waiter_cancels_request(self):
+        """Когда отменены все ожидающие, сам HTTP-запрос тоже отменяется и забывается"""
+        parser = GatedParser()
+        waiters = [asyncio.create_task(parser.get_vacancy_details("1")) for _ in range(2)]
+        await asyncio.sleep(0)
+        request = _inflight[(asyncio.get_running_loop(), "1")]
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+
+        assert request.task.cancelled()
+        assert _inflight == {}
+
+
+
+class FakeSession:
+    """Сессия БД, которая только записывает транзакционные вызовы"""
+
+    def __init__(self):
+        self.log = []
+
+    @asynccontextmanager
+    async def begin_nested(self):
+        self.log.append("savepoint")
+        try:
+            yield
+        except Exception:
+            self.log.append("rollback to savepoint")
+            raise
+        self.log.append("release")
+
+    async def commit(self):
+        self.log.append("commit")
+
+    async def rollback(self):
+        self.log.append("rollback")
+
+
+class FailingRowParser(HHParser):
+    """Пачка с вакансией hh_id=bad не записывается"""
+
+    async def _persist_batch(self, rows, companies, employers):
+        if any(row["hh_id"] == "bad" for row in rows):
+            raise ValueError("bad row")
+        return len(rows), 0
+
+
+class TestBatchTransactions:
+    """Транзакции parse_and_save: коммиты, откаты и SAVEPOINT на сессии-заглушке"""
+
+    @pytest.fixture
+    def stats(self):
+        return {"found": 0, "new": 0, "updated": 0, "errors": 0}
+
+    @pytest.mark.asyncio
+    async def test_bad_row_is_isolated_by_savepoint(self, stats):
+        """Упавшая пачка повторяется по одной вакансии в SAVEPOINT, теряется только плохая строка"""
+        db = FakeSession()
+        parser = FailingRowParser(db)
+        batch = {hh_id: {"hh_id": hh_id} for hh_id in ["1", "bad", "3"]}
+
+        await parser._flush_batch(batch, {"e1": {"hh_id": "e1"}}, {hh_id: "e1" for hh_id in batch}, stats)
+
+        assert stats["new"] == 2
+        assert stats["errors"] == 1
+        assert db.log == ["rollback", "savepoint", "release", "savepoint", "rollback to savepoint", "savepoint", "release", "commit"]
+        assert batch == {}
+
+    @pytest.mark.asyncio
+    async def test_clean_batch_commits_once(self, stats):
+        """Пачка без ошибок пишется без SAVEPOINT одним коммитом"""
+        db = FakeSession()
+        parser = FailingRowParser(db)
+        batch = {hh_id: {"hh_id": hh_id} for hh_id in ["1", "2"]}
+
+        await parser._flush_batch(batch, {"e1": {"hh_id": "e1"}}, {hh_id: "e1" for hh_id in batch}, stats)
+
+        assert stats["new"] == 2
+        assert db.log == ["commit"]
+
+    @pytest.mark.asyncio
+    async def test_abort_cancels_detail_requests(self):
+        """После ошибки записи parse_and_save не отправляет оставшиеся запросы деталей"""
+        class AbortingParser(GatedParser):
+            MAX_CONCURRENCY = 1
+            BATCH_SIZE = 1
+
+            async def search_vacancies(self, **kwargs):
+                return [{"id": str(i)} for i in range(5)]
+
+            async def _flush_batch(self, *args):
+                raise RuntimeError("db down")
+
+        parser = AbortingParser(FakeSession())
+        parser.gate.set()
+        await parser.parse_and_save(keywords=["fpga"])
+        sent = len(parser.requests)
+        await asyncio.sleep(0.05)
+
+        assert sent < 5
+        assert len(parser.requests) == sent
+
+
+async def flush(parser, vacancies, stats):
+    """Пишет вакансии в формате API HH одной пачкой, как parse_and_save"""
+    batch, companies, employers = {}, {}, {}
+    for vacancy in vacancies:
+        company = parser._company_row(vacancy["employer"])
+        row = parser._vacancy_row(vacancy)
+        companies[company["hh_id"]] = company
+        employers[row["hh_id"]] = company["hh_id"]
+        batch[row["hh_id"]] = row
+    await parser._flush_batch(batch, companies, employers, stats)
+
+
+class TestPersistBatch:
+    """Запись пачек в БД: upsert работодателей и вакансий, история изменений"""
+    STALE = datetime(2000, 1, 1)
+
+    @pytest.fixture
+    def parser(self, db_session):
+        return HHParser(db_session)
+
+    @pytest.fixture
+    def stats(self):
+        return {"found": 0, "new": 0, "updated": 0, "errors": 0}
+
+    async def mark_stale(self, db_session):
+        """Сдвигает updated_at в прошлое, чтобы было видно, обновил ли его upsert"""
+        await db_session.execute(update(Vacancy).values(updated_at=self.STALE))
+        await db_session.execute(update(Company).values(updated_at=self.STALE))
+
+    @pytest.mark.asyncio
+    async def test_unchanged_rerun_keeps_updated_at(self, db_session, parser, stats, hh_vacancy):
+        """Повторная запись той же вакансии обновляет только last_checked_at"""
+        await flush(parser, [hh_vacancy], stats)
+        await self.mark_stale(db_session)
+
+        await flush(parser, [hh_vacancy], stats)
+
+        assert (stats["new"], stats["updated"], stats["errors"]) == (1, 1, 0)
+        assert (await db_session.execute(select(Vacancy.updated_at))).scalar_one() == self.STALE
+        assert (await db_session.execute(select(Company.updated_at))).scalar_one() == self.STALE
+        versions = (await db_session.execute(select(VacancyVersion.change_type))).scalars().all()
+        assert versions == ["created"]
+
+    @pytest.mark.asyncio
+    async def test_changed_column_bumps_updated_at(self, db_session, parser, stats, hh_vacancy):
+        """Изменение любой отслеживаемой колонки, а не только title, сдвигает updated_at и пишется в историю"""
+        await flush(parser, [hh_vacancy], stats)
+        await self.mark_stale(db_session)
+        hh_vacancy["salary"] = {**hh_vacancy["salary"], "from": 200000}
+
+        await flush(parser, [hh_vacancy], stats)
+
+        vacancy = (await db_session.execute(select(Vacancy.salary_from, Vacancy.updated_at))).one()
+        assert vacancy.salary_from == 200000
+        assert vacancy.updated_at != self.STALE
+        assert (await db_session.execute(select(Company.updated_at))).scalar_one() == self.STALE
+        version = (await db_session.execute(select(VacancyVersion).where(VacancyVersion.change_type == "updated"))).scalar_one()
+        assert version.changed_fields == ["salary_from"]
+        assert version.salary_from == 200000
+
+    @pytest.mark.asyncio
+    async def test_stats_cache_invalidated_after_commit(self, monkeypatch, db_session, parser, stats, hh_vacancy):
+        """Кеш общей статистики сбрасывается после коммита пачки, а не до него"""
+        events = []
+        commit = db_session.commit
+
+        async def tracked_commit():
+            events.append("commit")
+            await commit()
+
+        async def invalidate():
+            events.append("invalidate")
+
+        monkeypatch.setattr(db_session, "commit", tracked_commit)
+        monkeypatch.setattr(analytics_service, "invalidate_overall_stats", invalidate)
+
+        await flush(parser, [hh_vacancy], stats)
+
+        assert events == ["commit", "invalidate"]
+
+    @pytest.mark.asyncio
+    async def test_bad_row_is_isolated_in_db(self, db_session, parser, stats, hh_vacancy):
+        """Упавшая пачка пишется по одной вакансии в SAVEPOINT: в БД попадают все строки, кроме плохой"""
+        bad = {**hh_vacancy, "id": "bad", "name": None}
+
+        await flush(parser, [hh_vacancy, bad, {**hh_vacancy, "id": "3"}], stats)
+
+        assert (stats["new"], stats["errors"]) == (2, 1)
+        assert (await db_session.execute(select(Vacancy.hh_id).order_by(Vacancy.hh_id))).scalars().all() == ["12345678", "3"]
+        assert len((await db_session.execute(select(VacancyVersion.id))).all()) == 2
@@ -0,0 +1,12 @@
+"""
+Даты для колонок DateTime без часового пояса
+"""
+from datetime import datetime, timezone
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    """Приводит дату с часовым поясом к UTC без tzinfo; наивная дата возвращается как есть.
+    Колонки DateTime хранят UTC без пояса, а asyncpg отклоняет aware-даты для них с TypeError"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
@@ -0,0 +1,24 @@
+"""
+Условные GET-запросы: ETag / If-None-Match
+"""
+import hashlib
+from typing import Any
+from starlette.requests import Request
+
+
+def make_etag(*parts: Any) -> str:
+    """ETag из полей, по которым видно изменение строки (id, updated_at, ...), без сериализации тела ответа"""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+    return f'"{digest}"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """True, если клиент уже имеет эту версию ресурса"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Слабые ETag (W/"...") сравниваются по значению, как требует RFC 9110 для If-None-Match
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates
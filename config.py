@@ -9,6 +9,16 @@ class Settings(BaseSettings):
     DATABASE_URL: str
     REDIS_URL: str
     
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 40
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_USE_LIFO: bool = True
+    DB_INSERT_PAGE_SIZE: int = 1000
+    DB_ECHO: bool = False
+    DB_RAISELOAD: bool = False
+    DB_PGBOUNCER: bool = False
+    
     SECRET_KEY: str = "change-me-in-production"
     
     API_HOST: str = "0.0.0.0"
@@ -16,6 +26,14 @@ class Settings(BaseSettings):
     
     HH_API_BASE_URL: str = "https://api.hh.ru"
     HH_API_TIMEOUT: int = 30
+    HH_CONN_LIMIT: int = 1024
+    HH_CONN_LIMIT_PER_HOST: int = 64
+    
+    PARSER_ENABLED: bool = True
+    PARSER_SCHEDULE_INTERVAL: int = 3600
+    REGION_COUNTS_REFRESH_INTERVAL: int = 300
+    DEFAULT_KEYWORDS: List[str] = []
+    DEFAULT_REGIONS: List[int] = []
     
     CORS_ORIGINS: List[str] = ["http://localhost:3000"]
     
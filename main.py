@@ -1,16 +1,32 @@
+from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from config import settings
 from app.api import api_router
+from app.core.cache import init_cache, close_cache
+from app.services.hh_parser import close_hh_parser
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_cache()
+    yield
+    await close_hh_parser()
+    await close_cache()
+
 
 app = FastAPI(
     title=settings.APP_NAME,
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -21,6 +37,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Сжатие ответов от 1 КБ; потоковые NDJSON-ответы сжимаются по мере отправки
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Setup static files and templates
 BASE_DIR = Path(__file__).resolve().parent
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "app" / "static")), name="static")